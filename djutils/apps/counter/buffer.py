@@ -0,0 +1,184 @@
+"""
+Write-behind buffering for ObjectCounter hits.
+
+Hits are collected in process, grouped by (content_type, object_id, user),
+and written with a single ``executemany`` INSERT when the buffer holds
+``COUNTER_BUFFER_SIZE`` hits or at most ``COUNTER_BUFFER_TIMEOUT`` seconds
+after a hit was buffered (a timer thread flushes quiet buffers). Pending hits
+are flushed when the process exits.
+
+Settings::
+
+    COUNTER_BUFFERED = True         # make count_object() buffer by default
+    COUNTER_BUFFER_SIZE = 500       # flush after this many pending hits
+    COUNTER_BUFFER_TIMEOUT = 5      # ...or after this many seconds
+"""
+import atexit
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.contrib.contenttypes.models import ContentType
+
+def insert_hits(model, rows):
+    """
+    Writes ``rows`` of (content_type_id, object_id, visited, user_id) into
+    the table of ``model`` with a single executemany call.
+    """
+    if not rows:
+        return
+    opts = model._meta
+    qn = connection.ops.quote_name
+    columns = [opts.get_field(name).column for name in
+               ('content_type', 'object_id', 'visited', 'user')]
+    query = "INSERT INTO %s (%s) VALUES (%s)" % (qn(opts.db_table),
+        ', '.join([qn(c) for c in columns]), ', '.join(['%s'] * len(columns)))
+    to_db = connection.ops.value_to_db_datetime
+    cursor = connection.cursor()
+    cursor.executemany(query, [(ct_id, object_id, to_db(visited), user_id)
+                               for ct_id, object_id, visited, user_id in rows])
+    transaction.commit_unless_managed()
+
+class HitBuffer(object):
+    """
+    Thread-safe in-process buffer of pending hits for a counter model.
+    """
+    def __init__(self, model, size=None, timeout=None):
+        self.model = model
+        if size is None:
+            size = getattr(settings, 'COUNTER_BUFFER_SIZE', 500)
+        if timeout is None:
+            timeout = getattr(settings, 'COUNTER_BUFFER_TIMEOUT', 5)
+        self.size = size
+        self.timeout = timeout
+        self._hits = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._last_flush = time.time()
+        self.flushes = 0
+        self.flushed = 0
+        self.last_flush_duration = 0.0
+        self.total_flush_duration = 0.0
+
+    def add(self, obj, user=None, visited=None):
+        """
+        Buffers a hit on ``obj`` and flushes if a threshold has been reached.
+        """
+        ct_id = ContentType.objects.get_for_model(obj).id
+        user_id = user and user.pk or None
+        if visited is None:
+            visited = datetime.datetime.now()
+        key = (ct_id, obj._get_pk_val(), user_id)
+        self._lock.acquire()
+        try:
+            self._hits.setdefault(key, []).append(visited)
+            self._pending += 1
+            should_flush = self._pending >= self.size or \
+                time.time() - self._last_flush >= self.timeout
+            if not should_flush:
+                self._schedule()
+        finally:
+            self._lock.release()
+        if should_flush:
+            self.flush()
+
+    def _schedule(self):
+        # Called with the lock held: makes sure a timer will flush the
+        # pending hits within ``timeout`` seconds.
+        if self._timer is None:
+            self._timer = threading.Timer(self.timeout, self._flush_on_timeout)
+            self._timer.setDaemon(True)
+            self._timer.start()
+
+    def _flush_on_timeout(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+    def pending(self):
+        "Returns the number of hits not written to the database yet."
+        return self._pending
+
+    def flush(self):
+        """
+        Writes every pending hit to the database. If the write fails the hits
+        are put back into the buffer and the exception is re-raised.
+        """
+        self._lock.acquire()
+        try:
+            hits, self._hits = self._hits, {}
+            pending, self._pending = self._pending, 0
+            self._last_flush = time.time()
+            timer, self._timer = self._timer, None
+        finally:
+            self._lock.release()
+        if timer is not None:
+            timer.cancel()
+        if not hits:
+            return 0
+        rows = []
+        for (ct_id, object_id, user_id), visits in hits.iteritems():
+            for visited in visits:
+                rows.append((ct_id, object_id, visited, user_id))
+        start = time.time()
+        try:
+            insert_hits(self.model, rows)
+        except:
+            self._restore(hits, pending)
+            raise
+        duration = time.time() - start
+        self.flushes += 1
+        self.flushed += pending
+        self.last_flush_duration = duration
+        self.total_flush_duration += duration
+        return pending
+
+    def _restore(self, hits, pending):
+        self._lock.acquire()
+        try:
+            for key, visits in hits.iteritems():
+                self._hits.setdefault(key, []).extend(visits)
+            self._pending += pending
+            self._schedule()
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of pending hits and flush timings
+        (in seconds).
+        """
+        return {
+            'pending': self._pending,
+            'flushes': self.flushes,
+            'flushed': self.flushed,
+            'last_flush_duration': self.last_flush_duration,
+            'total_flush_duration': self.total_flush_duration,
+        }
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+def get_hit_buffer(model):
+    "Returns the process-wide HitBuffer for ``model``, creating it if needed."
+    try:
+        return _buffers[model]
+    except KeyError:
+        _buffers_lock.acquire()
+        try:
+            if model not in _buffers:
+                _buffers[model] = HitBuffer(model)
+            return _buffers[model]
+        finally:
+            _buffers_lock.release()
+
+def flush_all():
+    "Flushes every hit buffer of this process."
+    for hit_buffer in _buffers.values():
+        hit_buffer.flush()
+
+atexit.register(flush_all)
@@ -0,0 +1,85 @@
+"""
+HyperLogLog cardinality estimator (Flajolet et al., "HyperLogLog: the
+analysis of a near-optimal cardinality estimation algorithm").
+
+The sketch is a fixed-size array of ``2 ** precision`` one-byte registers,
+so it serializes to a ``2 ** precision`` bytes string. The standard error of
+the estimate is about ``1.04 / sqrt(2 ** precision)``: 1.6% with the default
+precision of 12 (4 KB). Sketches with the same precision are merged by taking
+the maximum of each register, which gives the sketch of the union.
+"""
+import math
+from array import array
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from django.utils.encoding import smart_str
+
+def _hash(value):
+    return long(md5(smart_str(value)).hexdigest()[:16], 16)
+
+class HyperLogLog(object):
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            registers = array('B', [0] * self.size)
+        elif len(registers) != self.size:
+            raise ValueError("expected %d registers, got %d" % (self.size,
+                                                                len(registers)))
+        self.registers = registers
+
+    def position(self, value):
+        """
+        Returns the (register index, rank) pair ``value`` hashes to, with the
+        rank being the position of the leftmost 1 bit of the remaining bits.
+        """
+        hashed = _hash(value)
+        bits = 64 - self.precision
+        index = hashed >> bits
+        rest = hashed & ((1 << bits) - 1)
+        return index, bits - rest.bit_length() + 1
+
+    def add(self, value):
+        index, rank = self.position(value)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, registers):
+        "Merges a mapping of register index to rank into the sketch."
+        for index, rank in registers.iteritems():
+            if rank > self.registers[index]:
+                self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("can't merge sketches of different precision")
+        self.registers = array('B', map(max, self.registers, other.registers))
+
+    def count(self):
+        "Returns the estimated number of distinct values added."
+        m = self.size
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum([2.0 ** -r for r in self.registers])
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction: linear counting.
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return self.registers.tostring()
+
+    def from_bytes(cls, data, precision=12):
+        registers = array('B')
+        registers.fromstring(data)
+        return cls(precision, registers)
+    from_bytes = classmethod(from_bytes)
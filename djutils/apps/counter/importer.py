@@ -0,0 +1,196 @@
+"""
+Streaming import of web server access logs into the counter app.
+
+Lines are read lazily, parsed (optionally in a pool of processes), mapped
+to objects by a resolver and written in batches, either as raw ObjectCounter
+rows or directly into the rollups. Memory use doesn't depend on the size of
+the log.
+
+A resolver is a callable taking the path of a request and returning a
+(model, object_id) pair, or None for paths that don't refer to an object.
+The model can be a model class or an "app_label.modelname" string. It has to
+be picklable to be used with a process pool; PatternResolver is::
+
+    COUNTER_IMPORT_RESOLVER = PatternResolver((
+        (r'^/blog/(?P<pk>\d+)/', 'blog.post'),
+        (r'^/venues/(?P<pk>\d+)/', 'venues.venue'),
+    ))
+
+Usage::
+
+    from djutils.apps.counter.importer import import_visits
+    stats = import_visits(open('access.log'), resolver, processes=4)
+"""
+import datetime
+import gzip
+import re
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import get_model
+from django.contrib.contenttypes.models import ContentType
+
+LOG_RE = re.compile(r'^\S+ \S+ \S+ \[(?P<time>[^\]]+)\] '
+                    r'"(?P<method>[A-Z]+) (?P<path>\S+)[^"]*" (?P<status>\d{3}) ')
+
+def parse_line(line):
+    """
+    Parses a line in common or combined log format, returns a (visited, path)
+    pair for successful GET requests and None otherwise. The time zone offset
+    is dropped: times are imported as they appear in the log.
+    """
+    match = LOG_RE.match(line)
+    if match is None or match.group('method') != 'GET' or \
+            match.group('status') != '200':
+        return None
+    visited = datetime.datetime.strptime(match.group('time').split()[0],
+                                         '%d/%b/%Y:%H:%M:%S')
+    return visited, match.group('path')
+
+class PatternResolver(object):
+    """
+    Maps paths to objects with a list of (regex, model) pairs. The object id
+    is taken from the ``pk`` named group of the first matching regex, or
+    from its first group.
+    """
+    def __init__(self, patterns):
+        self.patterns = [(re.compile(regex), model) for regex, model in patterns]
+
+    def __call__(self, path):
+        for regex, model in self.patterns:
+            match = regex.search(path)
+            if match is not None:
+                groups = match.groupdict()
+                return model, int(groups.get('pk', match.group(1)))
+        return None
+
+def get_resolver(resolver=None):
+    """
+    Returns ``resolver``, importing it if it's a dotted path; defaults to the
+    COUNTER_IMPORT_RESOLVER setting.
+    """
+    if resolver is None:
+        resolver = getattr(settings, 'COUNTER_IMPORT_RESOLVER', None)
+        if resolver is None:
+            raise ValueError("No resolver given and COUNTER_IMPORT_RESOLVER "
+                             "isn't set.")
+    if isinstance(resolver, basestring):
+        module, attr = resolver.rsplit('.', 1)
+        resolver = getattr(__import__(module, {}, {}, [attr]), attr)
+    return resolver
+
+def open_log(path):
+    "Opens a log file, transparently decompressing .gz files."
+    if path.endswith('.gz'):
+        return gzip.open(path)
+    return open(path)
+
+def parse_lines(lines, resolver):
+    """
+    Returns a list of (model, object_id, visited) tuples for the lines that
+    resolve to an object.
+    """
+    hits = []
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        visited, path = parsed
+        resolved = resolver(path)
+        if resolved is not None:
+            hits.append((resolved[0], resolved[1], visited))
+    return hits
+
+_resolver = None
+
+def _init_worker(resolver):
+    global _resolver
+    _resolver = resolver
+
+def _parse_chunk(lines):
+    return len(lines), parse_lines(lines, _resolver)
+
+def _chunks(lines, size):
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _parsed_chunks(lines, resolver, chunk_size, processes):
+    if not processes:
+        for chunk in _chunks(lines, chunk_size):
+            yield len(chunk), parse_lines(chunk, resolver)
+        return
+    from multiprocessing import Pool
+    pool = Pool(processes, _init_worker, (resolver,))
+    try:
+        # Pool.imap would read the whole input ahead: keep a bounded
+        # number of chunks in flight instead.
+        in_flight = []
+        for chunk in _chunks(lines, chunk_size):
+            in_flight.append(pool.apply_async(_parse_chunk, (chunk,)))
+            if len(in_flight) >= processes * 2:
+                yield in_flight.pop(0).get()
+        for result in in_flight:
+            yield result.get()
+    finally:
+        pool.terminate()
+
+def import_visits(lines, resolver=None, batch_size=1000, rollups=False,
+                  processes=None, chunk_size=1000, callback=None):
+    """
+    Imports the hits found in ``lines``, an iterable of log lines.
+
+    Hits are written ``batch_size`` at a time, as ObjectCounter rows or, with
+    ``rollups``, added straight to ObjectCounterRollup. ``processes`` parses
+    chunks of ``chunk_size`` lines in a process pool. ``callback`` is called
+    with the current statistics after each batch.
+
+    Returns a dictionary with the number of lines read, hits imported,
+    elapsed seconds and lines per second.
+    """
+    from djutils.apps.counter.buffer import insert_hits
+    from djutils.apps.counter.models import ObjectCounter, ObjectCounterRollup
+    resolver = get_resolver(resolver)
+    content_types = {}
+    stats = {'lines': 0, 'hits': 0, 'elapsed': 0.0, 'lines_per_second': 0.0}
+    start = time.time()
+    batch = []
+
+    def write(batch):
+        if rollups:
+            manager = ObjectCounterRollup.objects
+            manager.add_hits(manager.count_visits([(ct_id, object_id, visited)
+                for ct_id, object_id, visited, user_id in batch]))
+        else:
+            insert_hits(ObjectCounter, batch)
+        stats['hits'] += len(batch)
+        stats['elapsed'] = time.time() - start
+        stats['lines_per_second'] = stats['lines'] / max(stats['elapsed'], 0.001)
+        if callback is not None:
+            callback(stats)
+
+    for read, hits in _parsed_chunks(lines, resolver, chunk_size, processes):
+        stats['lines'] += read
+        for model, object_id, visited in hits:
+            try:
+                ct_id = content_types[model]
+            except KeyError:
+                if isinstance(model, basestring):
+                    model_class = get_model(*model.split('.'))
+                else:
+                    model_class = model
+                ct_id = ContentType.objects.get_for_model(model_class).id
+                content_types[model] = ct_id
+            batch.append((ct_id, object_id, visited, None))
+            if len(batch) >= batch_size:
+                write(batch)
+                batch = []
+    if batch:
+        write(batch)
+    stats['elapsed'] = time.time() - start
+    stats['lines_per_second'] = stats['lines'] / max(stats['elapsed'], 0.001)
+    return stats
@@ -0,0 +1,58 @@
+import threading
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import connection, transaction
+from django.contrib.contenttypes.models import ContentType
+
+from djutils.apps.counter.models import ShardedCounter
+
+class Command(NoArgsCommand):
+    help = ("Measures concurrent ShardedCounter increments on the configured "
+            "database, comparing a single row with several shards.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--threads', dest='threads', type='int', default=8,
+            help='Number of concurrent threads.'),
+        make_option('--increments', dest='increments', type='int', default=500,
+            help='Increments performed by each thread.'),
+        make_option('--shards', dest='shards', default='1,8,32',
+            help='Comma separated list of shard counts to compare.'),
+    )
+
+    def handle_noargs(self, **options):
+        threads = options['threads']
+        increments = options['increments']
+        # Count on the ContentType of ShardedCounter itself, so the benchmark
+        # doesn't need a model of its own.
+        target = ContentType.objects.get_for_model(ShardedCounter)
+        for shards in [int(n) for n in options['shards'].split(',')]:
+            self._reset(target)
+            errors = []
+            def worker():
+                try:
+                    for i in xrange(increments):
+                        try:
+                            ShardedCounter.objects.increment(target,
+                                                             shards=shards)
+                        except Exception, e:
+                            transaction.rollback_unless_managed()
+                            errors.append(e)
+                finally:
+                    connection.close()
+            workers = [threading.Thread(target=worker) for i in range(threads)]
+            start = time.time()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.time() - start
+            total = threads * increments - len(errors)
+            print "%3d shard(s): %6d increments in %.2fs (%.0f/s), %d errors" % (
+                shards, total, elapsed, total / elapsed, len(errors))
+        self._reset(target)
+
+    def _reset(self, target):
+        ShardedCounter.objects.filter(content_type=ContentType.objects.get_for_model(target),
+                                      object_id=target.pk).delete()
+        transaction.commit_unless_managed()
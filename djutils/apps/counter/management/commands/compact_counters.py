@@ -0,0 +1,50 @@
+import datetime
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+
+from djutils.apps.counter.models import ObjectCounter, ObjectCounterRollup
+
+class Command(NoArgsCommand):
+    help = ("Adds the old ObjectCounter rows to the rollups and deletes them "
+            "in small batches.")
+    option_list = NoArgsCommand.option_list + (
+        make_option('--days', dest='days', type='int',
+            default=getattr(settings, 'COUNTER_RETENTION_DAYS', 90),
+            help='Keep the raw hits of the last DAYS days.'),
+        make_option('--batch-size', dest='batch_size', type='int', default=5000,
+            help='Number of primary keys deleted per transaction.'),
+        make_option('--sleep', dest='sleep', type='float', default=0,
+            help='Seconds to wait between batches.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+            default=False, help='Only report what would be deleted.'),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        dry_run = options['dry_run']
+        before = datetime.datetime.now() - datetime.timedelta(days=options['days'])
+        if not dry_run:
+            rolled_up = ObjectCounterRollup.objects.update_rollups()
+            if verbosity > 0:
+                print "Rolled up %d hits." % rolled_up
+        elif verbosity > 0:
+            print "Rollups are not updated in a dry run; only hits already " \
+                  "rolled up are counted."
+        start = time.time()
+        total = 0
+        for rows, last_pk in ObjectCounter.objects.delete_compacted(before,
+                options['batch_size'], dry_run=dry_run):
+            total += rows
+            if verbosity > 1:
+                print "%d rows up to pk %d" % (rows, last_pk)
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        elapsed = time.time() - start
+        if verbosity > 0:
+            print "%s %d hits older than %s in %.1fs (%.0f rows/s)." % (
+                dry_run and 'Would delete' or 'Deleted', total,
+                before.strftime('%Y-%m-%d %H:%M'), elapsed,
+                total / max(elapsed, 0.001))
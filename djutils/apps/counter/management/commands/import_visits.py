@@ -0,0 +1,37 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djutils.apps.counter.importer import import_visits, open_log
+
+class Command(BaseCommand):
+    help = "Imports object hits from web server access logs (common or combined format)."
+    args = '<logfile logfile ...>'
+    option_list = BaseCommand.option_list + (
+        make_option('--resolver', dest='resolver', default=None,
+            help='Dotted path to the resolver mapping paths to objects '
+                 '(defaults to COUNTER_IMPORT_RESOLVER).'),
+        make_option('--batch-size', dest='batch_size', type='int', default=1000,
+            help='Number of hits written per insert.'),
+        make_option('--processes', dest='processes', type='int', default=0,
+            help='Parse the logs in a pool of PROCESSES processes.'),
+        make_option('--rollups', action='store_true', dest='rollups',
+            default=False, help='Add the hits to the rollups instead of '
+                                'the raw ObjectCounter table.'),
+    )
+
+    def handle(self, *paths, **options):
+        if not paths:
+            raise CommandError("Enter at least one log file.")
+        verbosity = int(options.get('verbosity', 1))
+        def progress(stats):
+            if verbosity > 1:
+                print "%(lines)d lines, %(hits)d hits (%(lines_per_second).0f lines/s)" % stats
+        for path in paths:
+            stats = import_visits(open_log(path), options['resolver'],
+                batch_size=options['batch_size'], rollups=options['rollups'],
+                processes=options['processes'], callback=progress)
+            if verbosity > 0:
+                print "%s: %d lines, %d hits in %.1fs (%.0f lines/s)" % (path,
+                    stats['lines'], stats['hits'], stats['elapsed'],
+                    stats['lines_per_second'])
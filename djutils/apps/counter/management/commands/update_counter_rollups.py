@@ -0,0 +1,18 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from djutils.apps.counter.models import ObjectCounterRollup
+
+class Command(NoArgsCommand):
+    help = "Adds the hits recorded since the last run to the hourly and daily counter rollups."
+    option_list = NoArgsCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int', default=None,
+            help='Number of raw hits (by primary key) processed per transaction.'),
+    )
+
+    def handle_noargs(self, **options):
+        processed = ObjectCounterRollup.objects.update_rollups(
+            chunk_size=options.get('chunk_size'))
+        if int(options.get('verbosity', 1)) > 0:
+            print "Rolled up %d hits." % processed
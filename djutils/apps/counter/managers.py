@@ -1,28 +1,529 @@
-from django.db import models, connection
+import datetime
+import random
+
+from django.conf import settings
+from django.db import models, connection, transaction, IntegrityError
+from django.core.cache import cache
 from django.contrib.contenttypes.models import ContentType
+from djutils.apps.counter.buffer import get_hit_buffer
+from djutils.apps.counter.trending import get_tracker
+from djutils.apps.counter import uniques
+
+HOURLY, DAILY = 'h', 'd'
 
 class ObjectCounterManager(models.Manager):
-    def count_object(self, obj, user=None):
+    def count_object(self, obj, user=None, buffered=None, visitor=None):
+        """
+        Records a hit on ``obj``. Buffered hits are written in bulk by the
+        process-wide HitBuffer (see djutils.apps.counter.buffer), otherwise
+        the hit is saved immediately. ``buffered`` defaults to the
+        COUNTER_BUFFERED setting.
+
+        When COUNTER_TRENDING is True the hit is also fed to the trending
+        tracker (see djutils.apps.counter.trending), and when COUNTER_SHARDED
+        is True it increments the ShardedCounter of ``obj``. When COUNTER_UNIQUES is
+        True ``visitor`` (see djutils.apps.counter.uniques.visitor_id),
+        or the user id, is added to the unique visitors of ``obj``.
+        """
+        if getattr(settings, 'COUNTER_TRENDING', False):
+            content_type = ContentType.objects.get_for_model(obj)
+            get_tracker().record(content_type.id, obj._get_pk_val())
+        if getattr(settings, 'COUNTER_SHARDED', False):
+            from djutils.apps.counter.models import ShardedCounter
+            ShardedCounter.objects.increment(obj)
+        if getattr(settings, 'COUNTER_UNIQUES', False):
+            if visitor is None and user:
+                visitor = 'u:%s' % user.pk
+            if visitor is not None:
+                content_type = ContentType.objects.get_for_model(obj)
+                uniques.get_tracker().record(content_type.id,
+                                             obj._get_pk_val(), visitor)
+        if buffered is None:
+            buffered = getattr(settings, 'COUNTER_BUFFERED', False)
+        if buffered:
+            get_hit_buffer(self.model).add(obj, user)
+            return
         counter = self.model()
         counter.content_object = obj
         if user: counter.user = user
         counter.save()
 
-    def most_visited_for_model(self, model, num=10):
-        '''Inspired by http://www.djangosnippets.org/snippets/108/''' 
+    def flush_buffer(self):
+        "Writes the buffered hits to the database, returns how many were written."
+        return get_hit_buffer(self.model).flush()
+
+    def buffer_stats(self):
+        "Returns pending hits and flush timings of the hit buffer."
+        return get_hit_buffer(self.model).stats()
+
+    def most_visited_for_model(self, model, num=10, since=None, until=None,
+                               existing=True, timeout=None):
+        '''
+        Inspired by http://www.djangosnippets.org/snippets/108/
+
+        Returns the ``num`` most visited ``model`` objects, see
+        most_visited_ids() for the arguments.
+        '''
+        return self.most_visited_for_models([model], num, since, until,
+                                            existing, timeout)[model]
+
+    def most_visited_for_models(self, models, num=10, since=None, until=None,
+                                existing=True, timeout=None):
+        """
+        Returns a dictionary mapping each of ``models`` to its ``num`` most
+        visited objects. The rankings are fetched in one query.
+        """
+        rankings = self.most_visited_ids_for_models(models, num, since, until,
+                                                    existing, timeout)
+        result = {}
+        for model, object_ids in rankings.iteritems():
+            object_dict = model._default_manager.in_bulk(object_ids)
+            result[model] = [object_dict[object_id] for object_id in object_ids
+                             if object_id in object_dict]
+        return result
+
+    def most_visited_ids(self, model, num=10, since=None, until=None,
+                         existing=True, timeout=None):
+        """
+        Returns the primary keys of the ``num`` most visited ``model`` objects.
+
+        ``since`` and ``until`` restrict the hits to a time window. With
+        ``existing=False`` the hits aren't joined against the ``model`` table,
+        so ids of deleted objects may be returned. When the COUNTER_USE_ROLLUPS
+        setting is True the ranking is read from the ObjectCounterRollup table
+        instead of the raw hits.
+
+        Rankings are cached for ``timeout`` seconds (COUNTER_CACHE_TIMEOUT by
+        default, 0 disables caching); invalidate_most_visited() drops them.
+        """
+        return self.most_visited_ids_for_models([model], num, since, until,
+                                                existing, timeout)[model]
+
+    def most_visited_ids_for_models(self, models, num=10, since=None,
+                                    until=None, existing=True, timeout=None):
+        """
+        Like most_visited_ids(), for several models at once. Cached rankings
+        are read with a single get_many, the missing ones are computed with a
+        single query.
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'COUNTER_CACHE_TIMEOUT', 0)
+        content_types = dict([(model, ContentType.objects.get_for_model(model))
+                              for model in models])
+        rankings, keys = {}, {}
+        if timeout:
+            generations = cache.get_many([_generation_key(ct)
+                                          for ct in content_types.values()])
+            for model, ct in content_types.iteritems():
+                keys[model] = _ranking_key(ct, generations.get(
+                    _generation_key(ct), 0), num, since, until, existing)
+            cached = cache.get_many(keys.values())
+            for model, key in keys.iteritems():
+                if key in cached:
+                    rankings[model] = cached[key]
+        missing = [model for model in models if model not in rankings]
+        if not missing:
+            return rankings
+        if getattr(settings, 'COUNTER_USE_ROLLUPS', False):
+            from djutils.apps.counter.models import ObjectCounterRollup
+            computed = dict([(model, ObjectCounterRollup.objects.most_visited_ids(
+                model, num, since, until)) for model in missing])
+        else:
+            computed = self._query_rankings(missing, content_types, num,
+                                            since, until, existing)
+        if timeout:
+            cache.set_many(dict([(keys[model], object_ids) for model, object_ids
+                                 in computed.iteritems()]), timeout)
+        rankings.update(computed)
+        return rankings
+
+    def _query_rankings(self, models, content_types, num, since, until,
+                        existing):
+        qn = connection.ops.quote_name
+        secondary_table = qn(self.model._meta.db_table)
+        subqueries, params = [], []
+        for index, model in enumerate(models):
+            join = ''
+            if existing:
+                join = "INNER JOIN %s p ON (p.%s = s.object_id)" % (
+                    qn(model._meta.db_table), qn(model._meta.pk.column))
+            where = ['s.content_type_id = %s']
+            params.append(content_types[model].id)
+            if since is not None:
+                where.append('s.visited >= %s')
+                params.append(connection.ops.value_to_db_datetime(since))
+            if until is not None:
+                where.append('s.visited < %s')
+                params.append(connection.ops.value_to_db_datetime(until))
+            subqueries.append("""
+            SELECT * FROM (
+                SELECT s.content_type_id, s.object_id, COUNT(*) AS score
+                FROM %s s %s
+                WHERE %s
+                GROUP BY s.content_type_id, s.object_id
+                ORDER BY score DESC
+                LIMIT %d
+            ) r%d""" % (secondary_table, join, ' AND '.join(where), num, index))
+        cursor = connection.cursor()
+        cursor.execute(' UNION ALL '.join(subqueries), params)
+        scores = {}
+        for ct_id, object_id, score in cursor.fetchall():
+            scores.setdefault(ct_id, []).append((score, object_id))
+        rankings = {}
+        for model in models:
+            ranking = scores.get(content_types[model].id, [])
+            ranking.sort(key=lambda row: row[0], reverse=True)
+            rankings[model] = [object_id for score, object_id in ranking]
+        return rankings
+
+    def unique_visitors(self, obj, since=None, until=None):
+        """
+        Returns the approximate number of unique visitors of ``obj`` between
+        the ``since`` and ``until`` dates (both included, today by default).
+        """
+        content_type = ContentType.objects.get_for_model(obj)
+        return uniques.get_tracker().count(content_type.id, obj._get_pk_val(),
+                                           since, until)
+
+    def trending_scores(self, model, num=10):
+        """
+        Returns the ``num`` trending ``model`` objects as (object_id, estimate,
+        error) tuples. See djutils.apps.counter.trending for the error bounds.
+        """
+        content_type = ContentType.objects.get_for_model(model)
+        return get_tracker().top(content_type.id, num)
+
+    def trending_for_model(self, model, num=10):
+        """
+        Returns the ``num`` trending ``model`` objects, approximated in memory
+        from the recent hits without querying the counter table.
+        """
+        object_ids = [object_id for object_id, estimate, error
+                      in self.trending_scores(model, num)]
+        object_dict = model._default_manager.in_bulk(object_ids)
+        return [object_dict[object_id] for object_id in object_ids
+                if object_id in object_dict]
+
+    def invalidate_most_visited(self, model):
+        "Drops every cached ranking of ``model``."
+        key = _generation_key(ContentType.objects.get_for_model(model))
+        if not cache.add(key, 1):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1)
+
+    def compactable_range(self, before):
+        """
+        Returns the (lowest, highest) primary keys of the hits older than
+        ``before`` that have already been added to the rollups, or
+        (None, None) if there are none.
+        """
+        from djutils.apps.counter.models import CounterWatermark
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        pk = qn(opts.pk.column)
+        query = "SELECT MIN(%s), MAX(%s) FROM %s WHERE %s < %%s" % (pk, pk,
+            qn(opts.db_table), qn(opts.get_field('visited').column))
+        params = [connection.ops.value_to_db_datetime(before)]
+        try:
+            watermark = CounterWatermark.objects.get(
+                name=ObjectCounterRollupManager.watermark_name).value
+        except CounterWatermark.DoesNotExist:
+            return None, None
+        # The newest row is always kept: some backends (e.g. SQLite)
+        # reuse the primary keys of deleted rows at the end of the table,
+        # which would hide new hits behind the rollup watermark.
+        query += " AND %s <= %%s AND %s < (SELECT MAX(%s) FROM %s)" % (pk,
+            pk, pk, qn(opts.db_table))
+        params.append(watermark)
+        cursor = connection.cursor()
+        cursor.execute(query, params)
+        return cursor.fetchone()
+
+    def delete_compacted(self, before, batch_size=5000, dry_run=False):
+        """
+        Deletes the hits older than ``before`` that have already been added to
+        the rollups, one range of ``batch_size`` primary keys per transaction.
+        Yields (rows, last_primary_key) after each batch; with ``dry_run`` the
+        same rows are only counted.
+
+        The rows are selected again on every call, so an interrupted run is
+        resumed simply by calling it again.
+        """
+        lowest, highest = self.compactable_range(before)
+        if lowest is None:
+            return
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        pk = qn(opts.pk.column)
+        where = "%s >= %%s AND %s < %%s AND %s <= %%s AND %s < %%s" % (pk, pk,
+            pk, qn(opts.get_field('visited').column))
+        if dry_run:
+            query = "SELECT COUNT(*) FROM %s WHERE %s" % (qn(opts.db_table), where)
+        else:
+            query = "DELETE FROM %s WHERE %s" % (qn(opts.db_table), where)
+        before = connection.ops.value_to_db_datetime(before)
+        cursor = connection.cursor()
+        for start in xrange(lowest, highest + 1, batch_size):
+            cursor.execute(query, [start, start + batch_size, highest, before])
+            if dry_run:
+                rows = cursor.fetchone()[0]
+            else:
+                rows = cursor.rowcount
+                transaction.commit_unless_managed()
+            yield rows, min(start + batch_size - 1, highest)
+
+def _generation_key(content_type):
+    return 'djutils.counter.generation.%d' % content_type.id
+
+def _ranking_key(content_type, generation, num, since, until, existing):
+    window = '-'.join([bound and bound.strftime('%Y%m%d%H%M%S') or ''
+                       for bound in (since, until)])
+    return 'djutils.counter.most_visited.%d.%d.%d.%s.%d' % (content_type.id,
+        generation, num, window, existing and 1 or 0)
+
+def _truncate(value, period):
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if period == DAILY:
+        value = value.replace(hour=0)
+    return value
+
+class ObjectCounterRollupManager(models.Manager):
+    watermark_name = 'rollups'
+
+    def update_rollups(self, chunk_size=None):
+        """
+        Adds the ObjectCounter rows created since the last run to the hourly
+        and daily rollups, ``chunk_size`` rows (by primary key) at a time.
+        Each chunk is committed together with the watermark, so the job can
+        be interrupted and resumed without counting a hit twice.
+
+        Rows visited in the last COUNTER_ROLLUP_LAG seconds (5 minutes by
+        default), and every row after them, are left for the next run: a
+        row with a lower primary key may still be uncommitted (e.g. a
+        buffered insert), and it would be skipped for good once the
+        watermark has passed it.
+
+        Returns the number of raw rows processed.
+        """
+        from djutils.apps.counter.models import ObjectCounter, CounterWatermark
+        if chunk_size is None:
+            chunk_size = getattr(settings, 'COUNTER_ROLLUP_CHUNK_SIZE', 10000)
+        watermark, created = CounterWatermark.objects.get_or_create(
+            name=self.watermark_name)
+        opts = ObjectCounter._meta
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute("SELECT MAX(%s) FROM %s" % (qn(opts.pk.column),
+                                                  qn(opts.db_table)))
+        max_id = cursor.fetchone()[0] or 0
+        lag = getattr(settings, 'COUNTER_ROLLUP_LAG', 300)
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=lag)
+        cursor.execute("SELECT MIN(%s) FROM %s WHERE %s > %%s AND %s >= %%s" % (
+            qn(opts.pk.column), qn(opts.db_table), qn(opts.pk.column),
+            qn(opts.get_field('visited').column)),
+            [watermark.value, connection.ops.value_to_db_datetime(cutoff)])
+        recent_id = cursor.fetchone()[0]
+        if recent_id is not None:
+            max_id = min(max_id, recent_id - 1)
+        processed = 0
+        while watermark.value < max_id:
+            upper = min(watermark.value + chunk_size, max_id)
+            processed += self._rollup_chunk(watermark, upper)
+        return processed
+
+    def _rollup_chunk(self, watermark, upper):
+        from djutils.apps.counter.models import ObjectCounter
+        opts = ObjectCounter._meta
+        qn = connection.ops.quote_name
+        query = "SELECT %s, %s, %s FROM %s WHERE %s > %%s AND %s <= %%s" % (
+            qn(opts.get_field('content_type').column),
+            qn(opts.get_field('object_id').column),
+            qn(opts.get_field('visited').column),
+            qn(opts.db_table), qn(opts.pk.column), qn(opts.pk.column))
+        cursor = connection.cursor()
+        cursor.execute(query, [watermark.value, upper])
+        counts = {}
+        processed = 0
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            self.count_visits(rows, counts)
+            processed += len(rows)
+        watermark.value = upper
+        self.add_hits(counts, watermark)
+        return processed
+
+    def count_visits(self, visits, counts=None):
+        """
+        Counts ``visits``, an iterable of (content_type_id, object_id,
+        visited) tuples, per hour and per day. Returns the ``counts``
+        dictionary expected by add_hits().
+        """
+        if counts is None:
+            counts = {}
+        for ct_id, object_id, visited in visits:
+            for period in (HOURLY, DAILY):
+                key = (ct_id, object_id, period, _truncate(visited, period))
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    @transaction.commit_on_success
+    def add_hits(self, counts, watermark=None):
+        """
+        Adds ``counts``, a dictionary mapping (content_type_id, object_id,
+        period, start) to a number of hits, to the rollup table and saves
+        ``watermark`` in the same transaction.
+        """
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        to_db = connection.ops.value_to_db_datetime
+        table = qn(opts.db_table)
+        hits = qn(opts.get_field('hits').column)
+        where = ' AND '.join(['%s = %%s' % qn(opts.get_field(name).column)
+            for name in ('content_type', 'object_id', 'period', 'start')])
+        columns = ', '.join([qn(opts.get_field(name).column)
+            for name in ('content_type', 'object_id', 'period', 'start', 'hits')])
+        update = "UPDATE %s SET %s = %s + %%s WHERE %s" % (table, hits, hits, where)
+        insert = "INSERT INTO %s (%s) VALUES (%%s, %%s, %%s, %%s, %%s)" % (
+            table, columns)
+        cursor = connection.cursor()
+        for (ct_id, object_id, period, start), num in counts.iteritems():
+            params = [ct_id, object_id, period, to_db(start)]
+            cursor.execute(update, [num] + params)
+            if not cursor.rowcount:
+                cursor.execute(insert, params + [num])
+        if watermark is not None:
+            watermark.save()
+
+    def most_visited_ids(self, model, num=10, since=None, until=None):
+        """
+        Returns the primary keys of the ``num`` most visited ``model``
+        objects between ``since`` and ``until``, read from the rollups.
+        Daily rollups are used when both bounds fall on midnight, hourly
+        ones otherwise; bounds are rounded down to the rollup granularity.
+        """
+        period = DAILY
+        for bound in (since, until):
+            if bound is not None and bound != _truncate(bound, DAILY):
+                period = HOURLY
         content_type = ContentType.objects.get_for_model(model)
-        primary_table = model._meta.db_table
-        secondary_table = self.model()._meta.db_table
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        start = qn(opts.get_field('start').column)
+        where = ['%s = %%s' % qn(opts.get_field('content_type').column),
+                 '%s = %%s' % qn(opts.get_field('period').column)]
+        params = [content_type.id, period]
+        if since is not None:
+            where.append('%s >= %%s' % start)
+            params.append(connection.ops.value_to_db_datetime(
+                _truncate(since, period)))
+        if until is not None:
+            where.append('%s < %%s' % start)
+            params.append(connection.ops.value_to_db_datetime(
+                _truncate(until, period)))
+        object_id = qn(opts.get_field('object_id').column)
         query = """
-        SELECT p.id AS obj_id, COUNT(*) AS score
-        FROM %s p 
-        INNER JOIN %s s ON (p.id = s.object_id) 
-        WHERE s.content_type_id = %%s 
-        GROUP BY obj_id 
+        SELECT %s, SUM(%s) AS score
+        FROM %s
+        WHERE %s
+        GROUP BY %s
         ORDER BY score DESC
-        """ % (primary_table, secondary_table)
+        LIMIT %d""" % (object_id, qn(opts.get_field('hits').column),
+                 qn(opts.db_table), ' AND '.join(where), object_id, num)
         cursor = connection.cursor()
-        cursor.execute(query, [content_type.id])
-        object_ids = [row[0] for row in cursor.fetchall()[:num]]
+        cursor.execute(query, params)
+        return [row[0] for row in cursor.fetchall()]
+
+    def most_visited_for_model(self, model, num=10, since=None, until=None):
+        """
+        Like ObjectCounterManager.most_visited_for_model, but reads the
+        pre-aggregated rollups, so the cost doesn't grow with the number of
+        raw hits.
+        """
+        object_ids = self.most_visited_ids(model, num, since, until)
         object_dict = model._default_manager.in_bulk(object_ids)
-        return [object_dict[object_id] for object_id in object_ids]
+        return [object_dict[object_id] for object_id in object_ids
+                if object_id in object_dict]
+
+class ShardedCounterManager(models.Manager):
+    """
+    Increments pick a random shard and update it in place with
+    ``UPDATE ... SET count = count + n``; reads sum the shards and are cached
+    for COUNTER_SHARD_CACHE_TIMEOUT seconds.
+
+    The number of shards is read from the COUNTER_SHARDS setting, a dictionary
+    of "app_label.modelname" to shard count, and defaults to
+    COUNTER_DEFAULT_SHARDS (8)::
+
+        COUNTER_SHARDS = {'blog.post': 32}
+    """
+    def shards_for_model(self, model):
+        opts = model._meta
+        shards = getattr(settings, 'COUNTER_SHARDS', {})
+        return shards.get('%s.%s' % (opts.app_label, opts.module_name),
+                          getattr(settings, 'COUNTER_DEFAULT_SHARDS', 8))
+
+    def _cache_key(self, content_type, object_id):
+        return 'djutils.counter.total.%d.%s' % (content_type.id, object_id)
+
+    def increment(self, obj, amount=1, shards=None):
+        """
+        Adds ``amount`` to the counter of ``obj``. ``shards`` overrides the
+        number of shards configured for the model of ``obj``.
+        """
+        if shards is None:
+            shards = self.shards_for_model(obj.__class__)
+        content_type = ContentType.objects.get_for_model(obj)
+        object_id = obj._get_pk_val()
+        shard = random.randint(0, shards - 1)
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        count = qn(opts.get_field('count').column)
+        columns = [qn(opts.get_field(name).column)
+                   for name in ('content_type', 'object_id', 'shard')]
+        update = "UPDATE %s SET %s = %s + %%s WHERE %s" % (qn(opts.db_table),
+            count, count, ' AND '.join(['%s = %%s' % c for c in columns]))
+        params = [content_type.id, object_id, shard]
+        cursor = connection.cursor()
+        cursor.execute(update, [amount] + params)
+        if not cursor.rowcount:
+            sid = transaction.savepoint()
+            try:
+                cursor.execute("INSERT INTO %s (%s, %s) VALUES (%%s, %%s, %%s, %%s)"
+                    % (qn(opts.db_table), ', '.join(columns), count),
+                    params + [amount])
+                transaction.savepoint_commit(sid)
+            except IntegrityError:
+                # Another process created the shard in the meantime.
+                transaction.savepoint_rollback(sid)
+                cursor.execute(update, [amount] + params)
+        transaction.commit_unless_managed()
+        try:
+            cache.incr(self._cache_key(content_type, object_id), amount)
+        except ValueError:
+            pass
+
+    def total(self, obj, timeout=None):
+        "Returns the value of the counter of ``obj``."
+        if timeout is None:
+            timeout = getattr(settings, 'COUNTER_SHARD_CACHE_TIMEOUT', 60)
+        content_type = ContentType.objects.get_for_model(obj)
+        object_id = obj._get_pk_val()
+        key = self._cache_key(content_type, object_id)
+        value = cache.get(key)
+        if value is None:
+            opts = self.model._meta
+            qn = connection.ops.quote_name
+            cursor = connection.cursor()
+            cursor.execute("SELECT SUM(%s) FROM %s WHERE %s = %%s AND %s = %%s" % (
+                qn(opts.get_field('count').column), qn(opts.db_table),
+                qn(opts.get_field('content_type').column),
+                qn(opts.get_field('object_id').column)),
+                [content_type.id, object_id])
+            value = cursor.fetchone()[0] or 0
+            if timeout:
+                cache.set(key, value, timeout)
+        return value
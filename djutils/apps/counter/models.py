@@ -2,7 +2,8 @@ from django.db import models
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.contrib.auth.models import User
-from djutils.apps.counter.managers import ObjectCounterManager
+from djutils.apps.counter.managers import ObjectCounterManager, \
+     ObjectCounterRollupManager, ShardedCounterManager, HOURLY, DAILY
 
 class ObjectCounter(models.Model):
     content_type = models.ForeignKey(ContentType)
@@ -15,3 +16,58 @@ class ObjectCounter(models.Model):
 
     def __unicode__(self):
         return u'%s: %d' % (self.content_type.name, self.object_id)
+
+class ObjectCounterRollup(models.Model):
+    """
+    Pre-aggregated hits per object over an hour or a day, built from the raw
+    ObjectCounter rows by ObjectCounterRollup.objects.update_rollups().
+    """
+    PERIOD_CHOICES = (
+        (HOURLY, 'hour'),
+        (DAILY, 'day'),
+    )
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    start = models.DateTimeField(db_index=True)
+    hits = models.PositiveIntegerField(default=0)
+
+    objects = ObjectCounterRollupManager()
+
+    class Meta:
+        unique_together = (('content_type', 'period', 'start', 'object_id'),)
+
+    def __unicode__(self):
+        return u'%s: %d (%s %s)' % (self.content_type.name, self.object_id,
+                                    self.get_period_display(), self.start)
+
+class CounterWatermark(models.Model):
+    """
+    Stores how far a background job (e.g. the rollup builder) has processed
+    the ObjectCounter table, as the last processed primary key.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return u'%s: %d' % (self.name, self.value)
+
+class ShardedCounter(models.Model):
+    """
+    A live counter per object, split into several rows ("shards") so that
+    concurrent increments don't queue up on a single row lock. The value of
+    the counter is the sum of its shards.
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    shard = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    objects = ShardedCounterManager()
+
+    class Meta:
+        unique_together = (('content_type', 'object_id', 'shard'),)
+
+    def __unicode__(self):
+        return u'%s: %d [%d] = %d' % (self.content_type.name, self.object_id,
+                                      self.shard, self.count)
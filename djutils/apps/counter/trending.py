@@ -0,0 +1,283 @@
+"""
+Approximate "trending" objects, computed in memory from the stream of hits.
+
+Every process keeps one Space-Saving summary (Metwally, Agrawal, El Abbadi,
+"Efficient Computation of Frequent and Top-k Elements in Data Streams") per
+content type, fed by ObjectCounterManager.count_object when COUNTER_TRENDING
+is True. Every COUNTER_TRENDING_SYNC_INTERVAL seconds the local summary is
+merged into a shared one stored in the Django cache and then reset.
+
+Hits are weighted with forward exponential decay, so a hit loses half of its
+weight every COUNTER_TRENDING_HALF_LIFE seconds.
+
+Error bounds: a summary with ``k`` counters (COUNTER_TRENDING_CAPACITY) that
+has seen a total (decayed) weight ``N`` never underestimates a count, and
+overestimates it by at most ``N / k``; the per-object error is returned along
+with each estimate. Every object whose true weight exceeds ``N / k`` is
+guaranteed to be in the summary. Merged summaries keep the same bound
+(Agarwal et al., "Mergeable Summaries"). Memory is O(k) per content type
+regardless of the number of objects.
+
+Settings::
+
+    COUNTER_TRENDING = True
+    COUNTER_TRENDING_CAPACITY = 100
+    COUNTER_TRENDING_HALF_LIFE = 3600
+    COUNTER_TRENDING_SYNC_INTERVAL = 10
+    COUNTER_TRENDING_TIMEOUT = 86400    # lifetime of the shared summaries
+"""
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from djutils.cache.locks import acquire_lock, release_lock
+
+# Counts are rescaled to a new landmark before the decay weights overflow.
+MAX_WEIGHT = 2.0 ** 64
+
+class SpaceSaving(object):
+    """
+    Space-Saving summary of at most ``capacity`` counters, with optional
+    exponential decay (``half_life`` in seconds).
+    """
+    def __init__(self, capacity, half_life=None, landmark=None):
+        self.capacity = capacity
+        self.half_life = half_life
+        if landmark is None:
+            landmark = time.time()
+        self.landmark = landmark
+        self.total = 0.0
+        self.counters = {}
+        self._heap = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_heap']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._rebuild_heap()
+
+    def __len__(self):
+        return len(self.counters)
+
+    def _rebuild_heap(self):
+        self._heap = [(count, key) for key, (count, error)
+                      in self.counters.iteritems()]
+        heapq.heapify(self._heap)
+
+    def _weight(self, now):
+        if not self.half_life:
+            return 1.0
+        return 2.0 ** ((now - self.landmark) / float(self.half_life))
+
+    def _rescale(self, landmark):
+        factor = 2.0 ** ((self.landmark - landmark) / float(self.half_life))
+        for counter in self.counters.itervalues():
+            counter[0] *= factor
+            counter[1] *= factor
+        self.total *= factor
+        self.landmark = landmark
+        self._rebuild_heap()
+
+    def _pop_min(self):
+        # The heap holds stale entries for counters incremented since they
+        # were pushed: skip them until one matches the current count.
+        while True:
+            count, key = heapq.heappop(self._heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == count:
+                del self.counters[key]
+                return count
+
+    def add(self, key, count=1, now=None):
+        if now is None:
+            now = time.time()
+        weight = self._weight(now)
+        if weight > MAX_WEIGHT:
+            self._rescale(now)
+            weight = 1.0
+        value = count * weight
+        self.total += value
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += value
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[key] = [value, 0.0]
+        else:
+            minimum = self._pop_min()
+            counter = self.counters[key] = [minimum + value, minimum]
+        heapq.heappush(self._heap, (counter[0], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def minimum(self):
+        "Returns the smallest counter if the summary is full, 0 otherwise."
+        if len(self.counters) < self.capacity:
+            return 0.0
+        return min([count for count, error in self.counters.itervalues()])
+
+    def merge(self, other):
+        """
+        Adds the counts of ``other`` to this summary. A key missing from one
+        of the summaries is assumed to have that summary's minimum count.
+        """
+        if self.half_life and other.landmark != self.landmark:
+            other = other.copy()
+            other._rescale(self.landmark)
+        mine, theirs = self.minimum(), other.minimum()
+        merged = {}
+        for key in set(self.counters) | set(other.counters):
+            count, error = self.counters.get(key, (mine, mine))
+            other_count, other_error = other.counters.get(key, (theirs, theirs))
+            merged[key] = [count + other_count, error + other_error]
+        if len(merged) > self.capacity:
+            largest = heapq.nlargest(self.capacity, merged.iteritems(),
+                                     key=lambda item: item[1][0])
+            merged = dict(largest)
+        self.counters = merged
+        self.total += other.total
+        now = time.time()
+        if self._weight(now) > MAX_WEIGHT:
+            self._rescale(now)
+        else:
+            self._rebuild_heap()
+
+    def copy(self):
+        summary = SpaceSaving(self.capacity, self.half_life, self.landmark)
+        summary.total = self.total
+        summary.counters = dict([(key, list(counter)) for key, counter
+                                 in self.counters.iteritems()])
+        summary._rebuild_heap()
+        return summary
+
+    def top(self, num, now=None):
+        """
+        Returns the ``num`` heaviest keys as (key, estimate, error) tuples,
+        with the estimates decayed to ``now``. The true weight of a key lies
+        between ``estimate - error`` and ``estimate``.
+        """
+        if now is None:
+            now = time.time()
+        weight = self._weight(now)
+        largest = heapq.nlargest(num, self.counters.iteritems(),
+                                 key=lambda item: item[1][0])
+        return [(key, count / weight, error / weight)
+                for key, (count, error) in largest]
+
+class TrendingTracker(object):
+    """
+    Per-process summaries of recent hits, periodically merged into shared
+    summaries stored in the cache.
+    """
+    def __init__(self, capacity=None, half_life=None, sync_interval=None,
+                 timeout=None):
+        if capacity is None:
+            capacity = getattr(settings, 'COUNTER_TRENDING_CAPACITY', 100)
+        if half_life is None:
+            half_life = getattr(settings, 'COUNTER_TRENDING_HALF_LIFE', 3600)
+        if sync_interval is None:
+            sync_interval = getattr(settings,
+                                    'COUNTER_TRENDING_SYNC_INTERVAL', 10)
+        if timeout is None:
+            timeout = getattr(settings, 'COUNTER_TRENDING_TIMEOUT', 86400)
+        self.capacity = capacity
+        self.half_life = half_life
+        self.sync_interval = sync_interval
+        self.timeout = timeout
+        self._local = {}
+        self._lock = threading.Lock()
+        self._last_sync = time.time()
+
+    def _cache_key(self, content_type_id):
+        return 'djutils.counter.trending.%d' % content_type_id
+
+    def record(self, content_type_id, object_id, count=1):
+        self._lock.acquire()
+        try:
+            summary = self._local.get(content_type_id)
+            if summary is None:
+                summary = self._local[content_type_id] = SpaceSaving(
+                    self.capacity, self.half_life)
+            summary.add(object_id, count)
+            should_sync = time.time() - self._last_sync >= self.sync_interval
+        finally:
+            self._lock.release()
+        if should_sync:
+            self.sync()
+
+    def sync(self):
+        """
+        Merges the local summaries into the shared ones. Summaries whose
+        shared lock is busy are kept and merged on the next sync.
+        """
+        self._lock.acquire()
+        try:
+            local, self._local = self._local, {}
+            self._last_sync = time.time()
+        finally:
+            self._lock.release()
+        pending = {}
+        for content_type_id, summary in local.iteritems():
+            key = self._cache_key(content_type_id)
+            if not acquire_lock(key):
+                pending[content_type_id] = summary
+                continue
+            try:
+                shared = cache.get(key)
+                if shared is None:
+                    shared = summary
+                else:
+                    shared.merge(summary)
+                cache.set(key, shared, self.timeout)
+            finally:
+                release_lock(key)
+        if pending:
+            self._lock.acquire()
+            try:
+                for content_type_id, summary in pending.iteritems():
+                    current = self._local.get(content_type_id)
+                    if current is not None:
+                        summary.merge(current)
+                    self._local[content_type_id] = summary
+            finally:
+                self._lock.release()
+
+    def top(self, content_type_id, num=10):
+        """
+        Returns the ``num`` trending object ids of a content type as
+        (object_id, estimate, error) tuples, including this process' hits
+        that haven't been synced yet.
+        """
+        summary = cache.get(self._cache_key(content_type_id))
+        self._lock.acquire()
+        try:
+            local = self._local.get(content_type_id)
+            if summary is None:
+                summary = local and local.copy()
+            elif local is not None:
+                summary.merge(local)
+        finally:
+            self._lock.release()
+        if summary is None:
+            return []
+        return summary.top(num)
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def get_tracker():
+    "Returns the process-wide TrendingTracker."
+    global _tracker
+    if _tracker is None:
+        _tracker_lock.acquire()
+        try:
+            if _tracker is None:
+                _tracker = TrendingTracker()
+        finally:
+            _tracker_lock.release()
+    return _tracker
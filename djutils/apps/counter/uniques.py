@@ -0,0 +1,168 @@
+"""
+Approximate unique visitors per object and per day.
+
+Each (content_type, object_id, day) has a HyperLogLog sketch stored in the
+Django cache as a fixed-size bytes string (4 KB with the default precision).
+ObjectCounterManager.count_object feeds it when COUNTER_UNIQUES is True.
+Processes collect the changed registers locally and merge them into the
+cached sketches every COUNTER_UNIQUES_SYNC_INTERVAL seconds, holding a
+cache lock per sketch. Sketches of several days are merged to answer
+queries over a date range.
+
+Settings::
+
+    COUNTER_UNIQUES = True
+    COUNTER_UNIQUES_PRECISION = 12
+    COUNTER_UNIQUES_SYNC_INTERVAL = 10
+    COUNTER_UNIQUES_TIMEOUT = 2592000   # lifetime of a daily sketch
+"""
+import datetime
+import threading
+import time
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import smart_str
+
+from djutils.apps.counter.hll import HyperLogLog
+from djutils.cache.locks import acquire_lock, release_lock
+
+def visitor_id(request):
+    """
+    Returns a string identifying the visitor of ``request``: the user id for
+    authenticated users, the session key or a hash of the IP address and
+    user agent for anonymous ones.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return 'u:%s' % user.pk
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return 's:%s' % session.session_key
+    return 'a:%s' % sha1(smart_str('%s|%s' % (
+        request.META.get('REMOTE_ADDR', ''),
+        request.META.get('HTTP_USER_AGENT', '')))).hexdigest()
+
+class UniqueVisitorTracker(object):
+    def __init__(self, precision=None, sync_interval=None, timeout=None):
+        if precision is None:
+            precision = getattr(settings, 'COUNTER_UNIQUES_PRECISION', 12)
+        if sync_interval is None:
+            sync_interval = getattr(settings,
+                                    'COUNTER_UNIQUES_SYNC_INTERVAL', 10)
+        if timeout is None:
+            timeout = getattr(settings, 'COUNTER_UNIQUES_TIMEOUT', 2592000)
+        self.precision = precision
+        self.sync_interval = sync_interval
+        self.timeout = timeout
+        self._sketch = HyperLogLog(precision)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_sync = time.time()
+
+    def _cache_key(self, content_type_id, object_id, day):
+        return 'djutils.counter.uniques.%d.%s.%s' % (content_type_id,
+            object_id, day.strftime('%Y%m%d'))
+
+    def record(self, content_type_id, object_id, visitor, day=None):
+        if day is None:
+            day = datetime.date.today()
+        index, rank = self._sketch.position(visitor)
+        key = self._cache_key(content_type_id, object_id, day)
+        self._lock.acquire()
+        try:
+            registers = self._pending.setdefault(key, {})
+            if rank > registers.get(index, 0):
+                registers[index] = rank
+            should_sync = time.time() - self._last_sync >= self.sync_interval
+        finally:
+            self._lock.release()
+        if should_sync:
+            self.sync()
+
+    def sync(self):
+        """
+        Merges the locally changed registers into the cached sketches.
+        Sketches whose lock is busy are retried on the next sync.
+        """
+        self._lock.acquire()
+        try:
+            pending, self._pending = self._pending, {}
+            self._last_sync = time.time()
+        finally:
+            self._lock.release()
+        locked = [key for key in pending if acquire_lock(key)]
+        try:
+            stored = cache.get_many(locked)
+            updated = {}
+            for key in locked:
+                if key in stored:
+                    sketch = HyperLogLog.from_bytes(stored[key], self.precision)
+                else:
+                    sketch = HyperLogLog(self.precision)
+                sketch.update(pending.pop(key))
+                updated[key] = sketch.to_bytes()
+            cache.set_many(updated, self.timeout)
+        finally:
+            for key in locked:
+                release_lock(key)
+        if pending:
+            self._lock.acquire()
+            try:
+                for key, registers in pending.iteritems():
+                    current = self._pending.setdefault(key, {})
+                    for index, rank in registers.iteritems():
+                        if rank > current.get(index, 0):
+                            current[index] = rank
+            finally:
+                self._lock.release()
+
+    def sketch(self, content_type_id, object_id, since=None, until=None):
+        """
+        Returns the HyperLogLog sketch of the visitors between the ``since``
+        and ``until`` dates (both included, today by default), including the
+        registers not synced yet.
+        """
+        if until is None:
+            until = datetime.date.today()
+        if since is None:
+            since = until
+        keys = []
+        day = since
+        while day <= until:
+            keys.append(self._cache_key(content_type_id, object_id, day))
+            day += datetime.timedelta(days=1)
+        sketch = HyperLogLog(self.precision)
+        for data in cache.get_many(keys).itervalues():
+            sketch.merge(HyperLogLog.from_bytes(data, self.precision))
+        self._lock.acquire()
+        try:
+            for key in keys:
+                if key in self._pending:
+                    sketch.update(self._pending[key])
+        finally:
+            self._lock.release()
+        return sketch
+
+    def count(self, content_type_id, object_id, since=None, until=None):
+        return self.sketch(content_type_id, object_id, since, until).count()
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def get_tracker():
+    "Returns the process-wide UniqueVisitorTracker."
+    global _tracker
+    if _tracker is None:
+        _tracker_lock.acquire()
+        try:
+            if _tracker is None:
+                _tracker = UniqueVisitorTracker()
+        finally:
+            _tracker_lock.release()
+    return _tracker
@@ -1,28 +1,442 @@
+import datetime
+import threading
+import time
+import weakref
+from decimal import Decimal
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from django.conf import settings
 from django.core.cache import cache
+from django.db import connection
+from django.db.models import Model
+from django.utils.encoding import smart_str
 
-def cacheable(cache_key, timeout=3600):
-    """taken from http://www.djangosnippets.org/snippets/1130/"""
-    def paramed_decorator(func):
-        def decorated(self):
-            key = cache_key % self.__dict__
-            res = cache.get(key)
-            if res == None:
-                res = func(self)
-                cache.set(key, res, timeout)
+from djutils.cache.local import local_cache
+from djutils.cache.registry import registry
+from djutils.cache.locks import acquire_lock, release_lock
+from djutils.cache.serializers import get_serializer
+from djutils.cache.stats import get_sink, value_size
+from djutils.cache.tags import get_generations, invalidate_tags
+from djutils.threadpool import ThreadPool
+
+# Keys longer than this are hashed (memcached refuses keys over 250 bytes).
+MAX_KEY_LENGTH = 200
+
+refresh_pool = ThreadPool(getattr(settings, 'CACHE_REFRESH_WORKERS', 4),
+                          logger='djutils.cache')
+
+class CachedNone(object):
+    "Stored in place of None results, which the cache can't tell from misses."
+    def __eq__(self, other):
+        return isinstance(other, CachedNone)
+
+    def __ne__(self, other):
+        return not self == other
+
+CACHED_NONE = CachedNone()
+_missing = object()
+
+class PrefetchedValues(object):
+    """
+    The values loaded by prefetch(), per instance and method name. They are
+    kept out of the instances, so they aren't pickled along with them, and
+    forgotten when the instance is garbage collected.
+    """
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _forget(self, key):
+        self._values.pop(key, None)
+
+    def get(self, instance, name, default=None):
+        entry = self._values.get(id(instance))
+        if entry is None or entry[0]() is not instance:
+            return default
+        return entry[1].get(name, default)
+
+    def set(self, instance, name, value):
+        key = id(instance)
+        self._lock.acquire()
+        try:
+            entry = self._values.get(key)
+            if entry is None or entry[0]() is not instance:
+                ref = weakref.ref(instance, lambda ref: self._forget(key))
+                entry = self._values[key] = (ref, {})
+            entry[1][name] = value
+        finally:
+            self._lock.release()
+
+    def clear(self, instance):
+        "Forgets every value prefetched for ``instance``."
+        entry = self._values.get(id(instance))
+        if entry is not None and entry[0]() is instance:
+            self._forget(id(instance))
+
+prefetched_values = PrefetchedValues()
+
+# Argument types whose repr() is stable across processes and cheap.
+KEY_TYPES = (type(None), bool, int, long, float, str, unicode, Decimal,
+             datetime.date, datetime.time, datetime.timedelta)
+
+def _key_part(value):
+    if isinstance(value, Model):
+        return '%s:%s' % (value._meta, value._get_pk_val())
+    if isinstance(value, tuple):
+        return '(%s)' % ','.join([_key_part(item) for item in value])
+    if isinstance(value, KEY_TYPES):
+        return repr(value)
+    raise TypeError("Can't build a cache key from a %s argument, use "
+                    "key_func" % type(value).__name__)
+
+def normalize_key(key):
+    key = smart_str(key)
+    if len(key) > MAX_KEY_LENGTH or ' ' in key:
+        return 'djutils.hashed.%s' % md5(key).hexdigest()
+    return key
+
+def args_key(key, args, kwargs):
+    """
+    Appends a hash of the positional and keyword arguments to ``key``; model
+    instances are represented by their primary key. Other arguments must be
+    numbers, strings, dates, None or tuples of them, otherwise TypeError is
+    raised.
+    """
+    if not args and not kwargs:
+        return key
+    parts = [_key_part(arg) for arg in args]
+    keys = kwargs.keys()
+    keys.sort()
+    parts.extend(['%s=%s' % (k, _key_part(kwargs[k])) for k in keys])
+    return '%s.%s' % (key, md5(smart_str('|'.join(parts))).hexdigest())
+
+class CacheableMethod(object):
+    """
+    The cache logic behind a method decorated with ``cacheable``: key
+    building, (de)serialization and computation of missing values.
+    """
+    def __init__(self, func, cache_key, timeout, local, local_timeout,
+                 soft_timeout, background, tags, none_timeout, key_func,
+                 serializer):
+        self.func = func
+        self.cache_key = cache_key
+        self.timeout = timeout
+        self.local = local
+        self.local_timeout = local_timeout
+        self.soft_timeout = soft_timeout
+        self.background = background
+        self.tags = tags
+        self.none_timeout = none_timeout
+        self.key_func = key_func
+        self.serializer = serializer and get_serializer(serializer)
+        self.lock_timeout = getattr(settings, 'CACHE_REFRESH_LOCK_TIMEOUT', 60)
+        registry.append(self)
+        if key_func is not None:
+            self.template = '%s.%s' % (func.__module__, func.__name__)
+        else:
+            self.template = cache_key
+
+    def make_keys(self, instances, args=(), kwargs={}):
+        if self.key_func is not None:
+            keys = [self.key_func(instance, *args, **kwargs)
+                    for instance in instances]
+        else:
+            keys = [args_key(self.cache_key % instance.__dict__, args, kwargs)
+                    for instance in instances]
+        if self.tags:
+            instance_tags = [[tag % instance.__dict__ for tag in self.tags]
+                             for instance in instances]
+            unique_tags = {}
+            for names in instance_tags:
+                for name in names:
+                    unique_tags[name] = None
+            unique_tags = unique_tags.keys()
+            generations = dict(zip(unique_tags, get_generations(unique_tags)))
+            keys = ['%s.%s' % (key, '.'.join([str(generations[name])
+                                               for name in names]))
+                    for key, names in zip(keys, instance_tags)]
+        return [normalize_key(key) for key in keys]
+
+    def encode(self, value, now=None):
+        if value is None:
+            value = CACHED_NONE
+        if self.soft_timeout:
+            value = (value, (now or time.time()) + self.soft_timeout)
+        if self.serializer is not None:
+            value = self.serializer.dumps(value)
+        return value
+
+    def decode(self, entry):
+        """
+        Returns the value stored in a cache entry and the time it becomes
+        stale (None without ``soft_timeout``), or (_missing, None) for a
+        miss.
+        """
+        if entry is None:
+            return _missing, None
+        if self.serializer is not None:
+            entry = self.serializer.loads(entry)
+        stale_at = None
+        if self.soft_timeout:
+            entry, stale_at = entry
+        if entry == CACHED_NONE:
+            entry = None
+        return entry, stale_at
+
+    def entry_timeout(self, value):
+        if value is None and self.none_timeout is not None:
+            return self.none_timeout
+        return self.timeout
+
+    def store(self, key, value):
+        now = time.time()
+        encoded = self.encode(value, now)
+        cache.set(key, encoded, self.entry_timeout(value))
+        if self.local:
+            self.store_local(key, value,
+                             self.soft_timeout and now + self.soft_timeout)
+        return encoded
+
+    def store_local(self, key, value, stale_at=None):
+        # With soft_timeout the in-process entry carries the time it
+        # becomes stale, after which get() goes back to the shared cache.
+        if value is None:
+            value = CACHED_NONE
+        if self.soft_timeout:
+            value = (value, stale_at)
+        local_cache.set(key, value, self.local_timeout)
+
+    def load_local(self, key):
+        "Returns the fresh value of ``key`` in the local cache, or _missing."
+        res = local_cache.get(key, _missing)
+        if res is not _missing and self.soft_timeout:
+            res, stale_at = res
+            if stale_at <= time.time():
+                return _missing
+        return res
+
+    def compute(self, key, instance, args, kwargs):
+        sink = get_sink()
+        if sink is None:
+            res = self.func(instance, *args, **kwargs)
+            self.store(key, res)
             return res
+        start = time.time()
+        res = self.func(instance, *args, **kwargs)
+        elapsed = time.time() - start
+        sink.recompute(self.template, elapsed,
+                       value_size(res, self.store(key, res)))
+        return res
+
+    def refresh(self, key, instance, args, kwargs):
+        try:
+            return self.compute(key, instance, args, kwargs)
+        finally:
+            release_lock(key)
+
+    def background_refresh(self, *args):
+        try:
+            self.refresh(*args)
+        finally:
+            connection.close()
+
+    def get(self, instance, args, kwargs):
+        if not args and not kwargs:
+            res = prefetched_values.get(instance, self.func.__name__, _missing)
+            if res is not _missing:
+                return res
+        key = self.make_keys([instance], args, kwargs)[0]
+        sink = get_sink()
+        if self.local:
+            res = self.load_local(key)
+            if res is not _missing:
+                if sink is not None:
+                    sink.hit(self.template)
+                if res == CACHED_NONE:
+                    return None
+                return res
+        res, stale_at = self.decode(cache.get(key))
+        if res is _missing:
+            if sink is not None:
+                sink.miss(self.template)
+            return self.compute(key, instance, args, kwargs)
+        if sink is not None:
+            sink.hit(self.template)
+        stale = stale_at is not None and stale_at <= time.time()
+        if stale and acquire_lock(key, self.lock_timeout):
+            refresh_args = (key, instance, args, kwargs)
+            if not self.background or \
+                    not refresh_pool.submit(self.background_refresh,
+                                            *refresh_args):
+                return self.refresh(*refresh_args)
+        if self.local and not stale:
+            self.store_local(key, res, stale_at)
+        return res
+
+    def store_many(self, items, now=None):
+        "Stores a list of (key, value) pairs with a single set_many."
+        to_store, none_keys = {}, []
+        for key, value in items:
+            if value is None and self.none_timeout is not None:
+                none_keys.append(key)
+            else:
+                to_store[key] = self.encode(value, now)
+        if to_store:
+            cache.set_many(to_store, self.timeout)
+        for key in none_keys:
+            cache.set(key, self.encode(None, now), self.none_timeout)
+
+    def prefetch(self, instances, compute_many=None):
+        """
+        Loads the values of ``instances`` with one get_many, computes the
+        missing ones (with ``compute_many(instances)``, returning a list
+        of values in the same order, if given) and stores them with one
+        set_many. Every instance is seeded with its value (see
+        PrefetchedValues), so calling the method on it doesn't touch the
+        cache again until stales_cache or stales_tags runs on it. Only
+        methods without arguments can be prefetched.
+        """
+        instances = list(instances)
+        keys = self.make_keys(instances)
+        entries = cache.get_many(keys)
+        values, stale_ats, missing = {}, {}, []
+        now = time.time()
+        for instance, key in zip(instances, keys):
+            res, stale_at = self.decode(entries.get(key))
+            if res is _missing or (stale_at is not None and stale_at <= now):
+                missing.append((instance, key))
+            else:
+                values[key] = res
+                stale_ats[key] = stale_at
+        sink = get_sink()
+        if sink is not None:
+            sink.hit(self.template, len(values))
+        if missing:
+            if sink is not None:
+                sink.miss(self.template, len(missing))
+            start = time.time()
+            if compute_many is not None:
+                computed = compute_many([instance for instance, key in missing])
+            else:
+                computed = [self.func(instance) for instance, key in missing]
+            now = time.time()
+            if sink is not None:
+                elapsed = (now - start) / len(missing)
+                for res in computed:
+                    sink.recompute(self.template, elapsed, value_size(res))
+            items = []
+            for (instance, key), res in zip(missing, computed):
+                values[key] = res
+                stale_ats[key] = self.soft_timeout and now + self.soft_timeout
+                items.append((key, res))
+            self.store_many(items, now)
+        for instance, key in zip(instances, keys):
+            prefetched_values.set(instance, self.func.__name__, values[key])
+            if self.local:
+                self.store_local(key, values[key], stale_ats[key])
+        return instances
+
+def cacheable(cache_key, timeout=3600, local=False, local_timeout=None,
+              soft_timeout=None, background=False, tags=None,
+              none_timeout=None, key_func=None, serializer=None):
+    """
+    taken from http://www.djangosnippets.org/snippets/1130/
+
+    Arguments of the decorated method are hashed into the key; model
+    instances are represented by their primary key. Other arguments must be
+    numbers, strings, dates, None or tuples of them. ``key_func``, if given,
+    replaces ``cache_key`` and is called with the instance and the arguments
+    to build the key. Keys too long for memcached are hashed.
+
+    None results are cached too, for ``none_timeout`` seconds (``timeout``
+    by default).
+
+    ``serializer`` ('pickle', 'zlib' or an object with ``dumps`` and ``loads``
+    methods, see djutils.cache.serializers) turns values into strings before
+    they are stored; 'zlib' compresses the large ones.
+
+    With ``local`` the values are also kept in the in-process LRU cache
+    (see djutils.cache.local) for ``local_timeout`` seconds (``timeout`` by
+    default), so repeated reads don't hit the cache backend. They are only
+    served from there until their ``soft_timeout``.
+
+    With ``soft_timeout`` the value is considered stale after that many
+    seconds but is kept until ``timeout``. The first caller seeing a stale
+    value takes a lock and recomputes it, inline or, with ``background``,
+    in a thread pool; every other caller keeps getting the stale value in
+    the meantime.
+
+    ``tags`` is a list of tags (formatted with the instance's ``__dict__``,
+    like ``cache_key``) the value depends on: their generations are part of
+    the key, so stales_tags() or djutils.cache.tags.invalidate_tags()
+    invalidate it. Tagged values are not deleted by stales_cache.
+    """
+    if local_timeout is None:
+        local_timeout = timeout
+    def paramed_decorator(func):
+        method = CacheableMethod(func, cache_key, timeout, local, local_timeout,
+                                 soft_timeout, background, tags, none_timeout,
+                                 key_func, serializer)
+        def decorated(self, *args, **kwargs):
+            return method.get(self, args, kwargs)
         decorated.__doc__ = func.__doc__
         decorated.__dict__ = func.__dict__
+        decorated.__name__ = func.__name__
+        decorated.cacheable = method
+        decorated.prefetch = method.prefetch
         return decorated 
     return paramed_decorator
 
-def stales_cache(cache_key):
-    """taken from http://www.djangosnippets.org/snippets/1131/"""
+def stales_cache(cache_key, broadcast=False):
+    """
+    taken from http://www.djangosnippets.org/snippets/1131/
+
+    The key is dropped from the in-process cache too; with ``broadcast``
+    the other processes are told to drop it as well. Only the values of
+    methods called without arguments are deleted: use tags for the others.
+    Values prefetched for the instance are forgotten.
+    """
     def paramed_decorator(func):
         def decorated(self, *args, **kw):
-            key = cache_key % self.__dict__
+            key = normalize_key(cache_key % self.__dict__)
+            prefetched_values.clear(self)
             cache.delete(key)
+            if broadcast:
+                local_cache.broadcast(key)
+            else:
+                local_cache.delete(key)
             return func(self, *args, **kw)
         decorated.__doc__ = func.__doc__
         decorated.__dict__ = func.__dict__
         return decorated
     return paramed_decorator
+
+def stales_tags(*tags):
+    """
+    Invalidates every cached value depending on ``tags`` (formatted with the
+    instance's ``__dict__``) after the decorated method has run::
+
+        class Post(models.Model):
+            @cacheable('post.%(id)s.comment_count', tags=['post.%(id)s'])
+            def comment_count(self):
+                ...
+
+            @stales_tags('post.%(id)s', 'posts')
+            def save(self, *args, **kwargs):
+                ...
+    """
+    def paramed_decorator(func):
+        def decorated(self, *args, **kw):
+            try:
+                return func(self, *args, **kw)
+            finally:
+                prefetched_values.clear(self)
+                invalidate_tags(*[tag % self.__dict__ for tag in tags])
+        decorated.__doc__ = func.__doc__
+        decorated.__dict__ = func.__dict__
+        return decorated
+    return paramed_decorator
@@ -0,0 +1,137 @@
+"""
+In-process LRU cache used as a first level in front of the Django cache.
+
+Entries are dropped when ``stales_cache`` deletes the same key. To reach the
+other processes, invalidated keys are also appended to a log kept in the
+shared cache: every process checks the log at most once every
+CACHE_LOCAL_SYNC_INTERVAL seconds and drops the keys listed since its last
+check (or everything, if it fell too far behind).
+
+Settings::
+
+    CACHE_LOCAL_MAX_ENTRIES = 1000
+    CACHE_LOCAL_SYNC_INTERVAL = 1
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+INVALIDATIONS_KEY = 'djutils.cache.local.invalidations'
+# Processes that missed more invalidations than this clear their whole cache.
+MAX_BACKLOG = 100
+
+class LocalCache(object):
+    """
+    A bounded, thread-safe LRU cache with a timeout per entry, counting hits,
+    misses and evictions.
+    """
+    def __init__(self, max_entries=None, sync_interval=None):
+        if max_entries is None:
+            max_entries = getattr(settings, 'CACHE_LOCAL_MAX_ENTRIES', 1000)
+        if sync_interval is None:
+            sync_interval = getattr(settings, 'CACHE_LOCAL_SYNC_INTERVAL', 1)
+        self.max_entries = max_entries
+        self.sync_interval = sync_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sync = 0
+        self._last_invalidation = None
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.time()
+        if now - self._last_sync >= self.sync_interval:
+            self.sync()
+        self._lock.acquire()
+        try:
+            try:
+                value, expires = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= now:
+                self.misses += 1
+                return default
+            # Re-inserting moves the key to the most recently used end.
+            self._entries[key] = (value, expires)
+            self.hits += 1
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value, timeout=None):
+        expires = timeout and time.time() + timeout or None
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def broadcast(self, key):
+        """
+        Deletes ``key`` and appends it to the shared invalidation log, so
+        the other processes drop it on their next sync.
+        """
+        self.delete(key)
+        cache.add(INVALIDATIONS_KEY, 0)
+        try:
+            position = cache.incr(INVALIDATIONS_KEY)
+        except ValueError:
+            # The log expired in the meantime: everybody will clear.
+            cache.set(INVALIDATIONS_KEY, 0)
+            return
+        cache.set('%s.%d' % (INVALIDATIONS_KEY, position), key)
+
+    def sync(self):
+        "Drops the keys invalidated by other processes since the last sync."
+        self._last_sync = time.time()
+        position = cache.get(INVALIDATIONS_KEY)
+        if position is None:
+            cache.add(INVALIDATIONS_KEY, 0)
+            position = 0
+        last, self._last_invalidation = self._last_invalidation, position
+        if last is None or position == last:
+            return
+        if position < last or position - last > MAX_BACKLOG:
+            # The log expired or we are too far behind.
+            self.clear()
+            return
+        log_keys = ['%s.%d' % (INVALIDATIONS_KEY, n)
+                    for n in range(last + 1, position + 1)]
+        invalidated = cache.get_many(log_keys)
+        if len(invalidated) < len(log_keys):
+            self.clear()
+            return
+        for key in invalidated.itervalues():
+            self.delete(key)
+
+local_cache = LocalCache()
@@ -0,0 +1,15 @@
+"""
+Best-effort locks shared by every process using the same cache backend.
+
+A lock is a cache key created with ``cache.add``, which only succeeds for
+one caller. Locks expire after ``timeout`` seconds, so a crashed holder
+can't keep one forever.
+"""
+from django.core.cache import cache
+
+def acquire_lock(key, timeout=30):
+    "Returns True if the lock named ``key`` was acquired."
+    return cache.add('djutils.lock.%s' % key, 1, timeout)
+
+def release_lock(key):
+    cache.delete('djutils.lock.%s' % key)
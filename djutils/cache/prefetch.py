@@ -0,0 +1,56 @@
+"""
+Batch loading of ``@cacheable`` values for many instances at once.
+
+Rendering a list of objects that each use a cacheable method costs one cache
+round trip per object. prefetch_cacheable() loads all of them with a single
+``get_many``, computes only the misses and writes them back with a single
+``set_many``::
+
+    posts = prefetch_cacheable(Post.objects.all()[:50], 'comment_count')
+
+Misses can be computed in one query by passing ``compute_many``, a callable
+taking the list of instances missing from the cache and returning the list
+of their values in the same order.
+"""
+from itertools import islice
+
+def prefetch_cacheable(instances, method_name, compute_many=None):
+    """
+    Prefetches the ``method_name`` cacheable values of ``instances`` and
+    returns them as a list.
+    """
+    instances = list(instances)
+    if instances:
+        method = getattr(instances[0].__class__, method_name)
+        method.prefetch(instances, compute_many)
+    return instances
+
+class PrefetchIterable(object):
+    """
+    Wraps a queryset or any iterable, read lazily, and prefetches the cacheable methods
+    named in ``method_names`` for ``chunk_size`` instances at a time, while
+    iterating. ``compute_many`` maps a method name to its batch compute
+    function::
+
+        {% for post in posts %}{{ post.comment_count }}{% endfor %}
+
+        context['posts'] = PrefetchIterable(Post.objects.all(),
+                                            'comment_count', chunk_size=100)
+    """
+    def __init__(self, iterable, *method_names, **kwargs):
+        self.iterable = iterable
+        self.method_names = method_names
+        self.chunk_size = kwargs.get('chunk_size', 100)
+        self.compute_many = kwargs.get('compute_many', {})
+
+    def __iter__(self):
+        iterator = iter(self.iterable)
+        while True:
+            chunk = list(islice(iterator, self.chunk_size))
+            if not chunk:
+                return
+            for name in self.method_names:
+                prefetch_cacheable(chunk, name, self.compute_many.get(name))
+            for instance in chunk:
+                yield instance
+
@@ -0,0 +1,109 @@
+"""
+Registry of the ``@cacheable`` methods, and cache warming.
+
+Every CacheableMethod adds itself to ``registry`` when its method is
+decorated. cacheable_methods() finds the models they belong to, and warm()
+computes their values for a queryset ahead of traffic (see the warm_cache
+management command).
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import get_models
+
+registry = []
+
+def cacheable_methods(models=None):
+    """
+    Returns a list of (model, method name, CacheableMethod) for the cacheable
+    methods without arguments of ``models`` (every installed model by
+    default), including the inherited ones.
+    """
+    if models is None:
+        models = get_models()
+    registered = dict([(id(method), method) for method in registry])
+    result = []
+    for model in models:
+        seen = {}
+        for klass in model.__mro__:
+            for name, attr in klass.__dict__.items():
+                method = getattr(attr, 'cacheable', None)
+                if name not in seen and id(method) in registered and \
+                        method.func.func_code.co_argcount == 1:
+                    seen[name] = True
+                    result.append((model, name, method))
+    return result
+
+def _compute(method, instances, results, offset):
+    try:
+        for index, instance in enumerate(instances):
+            results[offset + index] = method.func(instance)
+    finally:
+        connection.close()
+
+def compute_values(method, instances, workers=1):
+    """
+    Computes the values of ``method`` for ``instances`` on at most
+    ``workers`` threads, returns them in the same order.
+    """
+    results = [None] * len(instances)
+    if workers <= 1 or len(instances) <= 1:
+        for index, instance in enumerate(instances):
+            results[index] = method.func(instance)
+        return results
+    size = (len(instances) + workers - 1) // workers
+    threads = []
+    for offset in range(0, len(instances), size):
+        thread = threading.Thread(target=_compute, args=(method,
+            instances[offset:offset + size], results, offset))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return results
+
+def warm(method, queryset, chunk_size=500, workers=1, rate=None, force=False,
+         callback=None):
+    """
+    Computes and stores the values of ``method`` for every object of
+    ``queryset``, reading the queryset ``chunk_size`` objects at a time by
+    primary key. Values already cached are skipped unless ``force``. At most
+    ``rate`` keys per second are written. ``callback`` is called with the
+    number of objects seen, keys written and elapsed seconds after each
+    chunk.
+
+    Returns (objects, keys, elapsed seconds).
+    """
+    start = time.time()
+    seen = written = 0
+    last_pk = None
+    queryset = queryset.order_by('pk')
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        instances = list(chunk[:chunk_size])
+        if not instances:
+            break
+        last_pk = instances[-1].pk
+        seen += len(instances)
+        keys = method.make_keys(instances)
+        if not force:
+            cached = cache.get_many(keys)
+            pairs = [(instance, key) for instance, key in zip(instances, keys)
+                     if key not in cached]
+            instances = [instance for instance, key in pairs]
+            keys = [key for instance, key in pairs]
+        if instances:
+            values = compute_values(method, instances, workers)
+            method.store_many(zip(keys, values))
+            written += len(keys)
+        elapsed = time.time() - start
+        if rate and written > rate * elapsed:
+            time.sleep(written / float(rate) - elapsed)
+            elapsed = time.time() - start
+        if callback is not None:
+            callback(seen, written, elapsed)
+    return seen, written, time.time() - start
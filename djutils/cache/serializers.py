@@ -0,0 +1,52 @@
+"""
+Serializers turning cached values into strings before they reach the cache
+backend, for ``cacheable(serializer=...)``.
+"""
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+class PickleSerializer(object):
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, value):
+        return pickle.dumps(value, self.protocol)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+class ZlibPickleSerializer(PickleSerializer):
+    """
+    Pickles values and compresses the ones larger than ``threshold`` bytes.
+    A one byte prefix tells compressed and plain values apart.
+    """
+    def __init__(self, threshold=1024, level=6, protocol=pickle.HIGHEST_PROTOCOL):
+        super(ZlibPickleSerializer, self).__init__(protocol)
+        self.threshold = threshold
+        self.level = level
+
+    def dumps(self, value):
+        data = pickle.dumps(value, self.protocol)
+        if len(data) > self.threshold:
+            return 'z' + zlib.compress(data, self.level)
+        return 'p' + data
+
+    def loads(self, data):
+        if data[0] == 'z':
+            return pickle.loads(zlib.decompress(data[1:]))
+        return pickle.loads(data[1:])
+
+SERIALIZERS = {
+    'pickle': PickleSerializer,
+    'zlib': ZlibPickleSerializer,
+}
+
+def get_serializer(serializer):
+    "Returns a serializer instance from a name in SERIALIZERS or an instance."
+    if isinstance(serializer, basestring):
+        return SERIALIZERS[serializer]()
+    return serializer
@@ -0,0 +1,208 @@
+"""
+Instrumentation of ``@cacheable`` methods.
+
+Hits, misses, recomputation times and value sizes are reported to a sink,
+aggregated per key template (the ``cache_key`` of the decorator, or the
+name of the method when a ``key_func`` is used). The sink is chosen with the
+CACHE_STATS_SINK setting, a dotted path to a class or instance; without it
+the hit path only pays for one attribute check::
+
+    CACHE_STATS_SINK = 'djutils.cache.stats.MemorySink'
+
+    from djutils.cache.stats import get_sink
+    get_sink().snapshot()
+
+Sinks implement ``hit(template, count=1)``, ``miss(template, count=1)`` and
+``recompute(template, seconds, size)``.
+"""
+import logging
+import re
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+class MemorySink(object):
+    "Keeps the counters in memory, e.g. to be shown by a stats view."
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, template):
+        try:
+            return self._stats[template]
+        except KeyError:
+            self._lock.acquire()
+            try:
+                return self._stats.setdefault(template, {
+                    'hits': 0, 'misses': 0, 'recomputes': 0,
+                    'recompute_time': 0.0, 'max_recompute_time': 0.0,
+                    'bytes': 0, 'max_bytes': 0,
+                })
+            finally:
+                self._lock.release()
+
+    def _add(self, template, counter, count):
+        entry = self._entry(template)
+        self._lock.acquire()
+        try:
+            entry[counter] += count
+        finally:
+            self._lock.release()
+
+    def hit(self, template, count=1):
+        self._add(template, 'hits', count)
+
+    def miss(self, template, count=1):
+        self._add(template, 'misses', count)
+
+    def recompute(self, template, seconds, size):
+        entry = self._entry(template)
+        self._lock.acquire()
+        try:
+            entry['recomputes'] += 1
+            entry['recompute_time'] += seconds
+            entry['max_recompute_time'] = max(entry['max_recompute_time'],
+                                              seconds)
+            entry['bytes'] += size
+            entry['max_bytes'] = max(entry['max_bytes'], size)
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """
+        Returns a dictionary of key template to counters, with the hit ratio
+        and the average recomputation time and size.
+        """
+        result = {}
+        for template, entry in self._stats.items():
+            entry = entry.copy()
+            lookups = entry['hits'] + entry['misses']
+            entry['hit_ratio'] = lookups and float(entry['hits']) / lookups or 0.0
+            recomputes = entry['recomputes'] or 1
+            entry['avg_recompute_time'] = entry['recompute_time'] / recomputes
+            entry['avg_bytes'] = entry['bytes'] / recomputes
+            result[template] = entry
+        return result
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._stats.clear()
+        finally:
+            self._lock.release()
+
+class LoggingSink(object):
+    "Logs misses and recomputations to the 'djutils.cache' logger."
+    def __init__(self, logger='djutils.cache'):
+        self.logger = logging.getLogger(logger)
+
+    def hit(self, template, count=1):
+        pass
+
+    def miss(self, template, count=1):
+        self.logger.debug("cache miss: %s (%d)", template, count)
+
+    def recompute(self, template, seconds, size):
+        self.logger.info("cache recompute: %s in %.1fms, %d bytes", template,
+                         seconds * 1000, size)
+
+class StatsdSink(object):
+    """
+    Sends the counters to a StatsD server over UDP, as
+    ``<prefix>.<template>.hit``, ``.miss`` (counters), ``.recompute``
+    (timer, in milliseconds) and ``.size`` (histogram, in bytes).
+    Settings: CACHE_STATSD_HOST, CACHE_STATSD_PORT, CACHE_STATSD_PREFIX.
+    """
+    def __init__(self, host=None, port=None, prefix=None):
+        if host is None:
+            host = getattr(settings, 'CACHE_STATSD_HOST', 'localhost')
+        if port is None:
+            port = getattr(settings, 'CACHE_STATSD_PORT', 8125)
+        if prefix is None:
+            prefix = getattr(settings, 'CACHE_STATSD_PREFIX', 'djutils.cache')
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._names = {}
+
+    def _name(self, template):
+        try:
+            return self._names[template]
+        except KeyError:
+            name = re.sub(r'[^A-Za-z0-9_.-]+', '_', template).strip('_.')
+            name = self._names[template] = '%s.%s' % (self.prefix, name)
+            return name
+
+    def _send(self, data):
+        try:
+            self.socket.sendto(data, self.address)
+        except socket.error:
+            pass
+
+    def hit(self, template, count=1):
+        self._send('%s.hit:%d|c' % (self._name(template), count))
+
+    def miss(self, template, count=1):
+        self._send('%s.miss:%d|c' % (self._name(template), count))
+
+    def recompute(self, template, seconds, size):
+        name = self._name(template)
+        self._send('%s.recompute:%d|ms\n%s.size:%d|h' % (name, seconds * 1000,
+                                                         name, size))
+
+_sink = None
+_sink_loaded = False
+
+def get_sink():
+    "Returns the sink configured with CACHE_STATS_SINK, or None."
+    global _sink, _sink_loaded
+    if not _sink_loaded:
+        sink = getattr(settings, 'CACHE_STATS_SINK', None)
+        if isinstance(sink, basestring):
+            module, attr = sink.rsplit('.', 1)
+            sink = getattr(__import__(module, {}, {}, [attr]), attr)
+        if isinstance(sink, type):
+            sink = sink()
+        _sink, _sink_loaded = sink, True
+    return _sink
+
+def set_sink(sink):
+    "Replaces the configured sink (None disables the instrumentation)."
+    global _sink, _sink_loaded
+    _sink, _sink_loaded = sink, True
+
+def value_size(value, serialized=None):
+    "Returns the size in bytes of a value as stored in the cache."
+    if serialized is not None and isinstance(serialized, str):
+        return len(serialized)
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, TypeError):
+        return 0
+
+def measure_hit_overhead(method, instance, iterations=100000):
+    """
+    Returns the cost, in microseconds, that the MemorySink adds to a cache
+    hit of ``method`` (a cacheable method, preferably with ``local=True``
+    so the cache backend doesn't dominate the measure) on ``instance``.
+    """
+    previous = get_sink()
+    method(instance)
+    try:
+        timings = []
+        for sink in (None, MemorySink()):
+            set_sink(sink)
+            start = time.time()
+            for i in xrange(iterations):
+                method(instance)
+            timings.append(time.time() - start)
+    finally:
+        set_sink(previous)
+    return (timings[1] - timings[0]) / iterations * 1000000
@@ -0,0 +1,95 @@
+"""
+Generational invalidation of whole families of cache keys.
+
+Every tag has a generation number stored in the cache. Keys of values
+depending on a tag embed its current generation; bumping the generation with
+a single ``incr`` makes all of them unreachable at once, and the old values
+simply expire.
+
+Tags are strings, usually built from a model instance, e.g.
+``'post.%(id)s'`` or ``'posts'``. Generations are kept for CACHE_TAG_TIMEOUT
+seconds (30 days by default).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import signals
+
+TAG_TIMEOUT = getattr(settings, 'CACHE_TAG_TIMEOUT', 30 * 86400)
+
+def tag_key(tag):
+    return 'djutils.cache.tag.%s' % tag
+
+def _initial_generation():
+    # Start from the current time rather than 1, so a generation evicted
+    # from the cache is never reused for keys that may still be around.
+    return int(time.time() * 1000)
+
+def get_generations(tags):
+    "Returns the current generation of each of ``tags``, in one get_many."
+    keys = [tag_key(tag) for tag in tags]
+    generations = cache.get_many(keys)
+    result = []
+    for key in keys:
+        generation = generations.get(key)
+        if generation is None:
+            generation = _initial_generation()
+            if not cache.add(key, generation, TAG_TIMEOUT):
+                generation = cache.get(key, generation)
+        result.append(generation)
+    return result
+
+def invalidate_tags(*tags):
+    "Invalidates every key depending on one of ``tags``."
+    for tag in tags:
+        key = tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_generation(), TAG_TIMEOUT)
+
+def invalidate_on_change(model, *tags):
+    """
+    Invalidates ``tags`` whenever an instance of ``model`` is saved or
+    deleted. The tags are formatted with the instance's ``__dict__``::
+
+        invalidate_on_change(Comment, 'comments', 'post.%(post_id)s')
+    """
+    def handler(sender, instance, **kwargs):
+        invalidate_tags(*[tag % instance.__dict__ for tag in tags])
+    uid = 'djutils.cache.tags.%s.%s' % (model._meta.db_table, '|'.join(tags))
+    signals.post_save.connect(handler, sender=model, weak=False,
+                              dispatch_uid=uid)
+    signals.post_delete.connect(handler, sender=model, weak=False,
+                                dispatch_uid=uid)
+    return handler
+
+_model_tag_prefixes = set()
+
+def register_model_tags(prefix):
+    """
+    Makes every model invalidate the tag ``'<prefix>.<db_table>'`` (see
+    model_tag) whenever one of its instances is saved or deleted. Call it
+    at import time, so processes changing models without ever reading the
+    tags still invalidate them.
+    """
+    _model_tag_prefixes.add(prefix)
+
+def model_tag(model, prefix):
+    """
+    Returns the tag ``'<prefix>.<db_table>'``, invalidated whenever an
+    instance of ``model`` is saved or deleted once ``prefix`` is registered
+    with register_model_tags.
+    """
+    return '%s.%s' % (prefix, model._meta.db_table)
+
+def _invalidate_model_tags(sender, **kwargs):
+    if _model_tag_prefixes:
+        invalidate_tags(*[model_tag(sender, prefix)
+                          for prefix in _model_tag_prefixes])
+
+signals.post_save.connect(_invalidate_model_tags,
+                          dispatch_uid='djutils.cache.tags.model_tags')
+signals.post_delete.connect(_invalidate_model_tags,
+                            dispatch_uid='djutils.cache.tags.model_tags')
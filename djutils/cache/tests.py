@@ -0,0 +1,35 @@
+import socket
+
+from django.utils import unittest
+
+from djutils.cache.stats import StatsdSink
+
+class StatsdSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.settimeout(2)
+        host, port = self.listener.getsockname()
+        self.sink = StatsdSink(host, port, prefix='test')
+
+    def tearDown(self):
+        self.sink.socket.close()
+        self.listener.close()
+
+    def receive(self):
+        return self.listener.recvfrom(1024)[0]
+
+    def test_counters(self):
+        self.sink.hit('post.%(id)s.comment_count')
+        self.assertEqual(self.receive(), 'test.post._id_s.comment_count.hit:1|c')
+        self.sink.miss('post.%(id)s.comment_count', 3)
+        self.assertEqual(self.receive(), 'test.post._id_s.comment_count.miss:3|c')
+
+    def test_recompute(self):
+        self.sink.recompute('posts', 0.25, 1024)
+        self.assertEqual(self.receive(),
+                         'test.posts.recompute:250|ms\ntest.posts.size:1024|h')
+
+    def test_unreachable_server(self):
+        self.listener.close()
+        self.sink.hit('posts')
@@ -1,19 +1,61 @@
-from django.core.serializers import serialize
+from itertools import islice
+
+from django.core.serializers import serialize, get_serializer
 from django.db.models.query import QuerySet
 from django.http import HttpResponse
+from django.utils.http import http_date, quote_etag
 from django.utils import simplejson
 from django.core.serializers.json import DjangoJSONEncoder 
 
-__all__ = ['JsonResponse', 'XmlResponse', 'YamlResponse']
+from djutils.http.compression import choose_encoding, compress_chunks
+from djutils.http.serializers import get_plan, serialize_json
+from djutils.http.validators import not_modified, timestamp
+
+__all__ = ['JsonResponse', 'FastJsonResponse', 'StreamingJsonResponse',
+           'XmlResponse', 'YamlResponse']
 
 class SerializedResponse(HttpResponse):
-    def __init__(self, object):
-        content = self._serialize(object)
+    """
+    Serializes ``object``; ``options`` (e.g. ``fields``) are passed to the
+    serializer.
+
+    Given a ``request`` and a ``validator`` (see djutils.http.validators),
+    the response carries ETag/Last-Modified headers and is a 304 without
+    serializing anything when the request's conditional headers match.
+
+    With ``compress`` the content is gzipped or deflated, as a stream and
+    at ``compresslevel``, if the request's Accept-Encoding allows it.
+    """
+    def __init__(self, object, request=None, validator=None, compress=False,
+                 compresslevel=6, **options):
+        self.options = options
+        etag = last_modified = None
+        if validator is not None:
+            etag, last_modified = validator(object)
         mimetype = getattr(self, 'mimetype', 'application/%s' % self.format)
-        super(SerializedResponse, self).__init__(content, mimetype)
+        if request is not None and not_modified(request, etag, last_modified):
+            super(SerializedResponse, self).__init__('', mimetype, status=304)
+        else:
+            content = self._serialize(object)
+            encoding = None
+            if compress and request is not None:
+                encoding = choose_encoding(request)
+            if encoding is not None:
+                if isinstance(content, basestring):
+                    content = [content]
+                content = compress_chunks(content, encoding, compresslevel)
+            super(SerializedResponse, self).__init__(content, mimetype)
+            if encoding is not None:
+                self['Content-Encoding'] = encoding
+        if compress:
+            self['Vary'] = 'Accept-Encoding'
+        if etag is not None:
+            self['ETag'] = quote_etag(etag)
+        if last_modified is not None:
+            self['Last-Modified'] = http_date(timestamp(last_modified))
         
     def _serialize(self, object):
-        return serialize(self.format, object)
+        return serialize(self.format, object, **self.options)
 
 class JsonResponse(SerializedResponse):
     format = 'json'
@@ -23,6 +65,71 @@ class JsonResponse(SerializedResponse):
             return super(JsonResponse, self)._serialize(object)
         return simplejson.dumps(object, cls=DjangoJSONEncoder)
 
+def iter_json(queryset, chunk_size=100, ndjson=False, **options):
+    """
+    Serializes ``queryset`` to JSON lazily, reading it with ``iterator()``
+    and yielding one string per ``chunk_size`` objects. The concatenated
+    output is identical to ``serialize('json', queryset, **options)``; with
+    ``ndjson`` every object is written on its own line instead.
+    """
+    encoder = DjangoJSONEncoder()
+    serializer = get_serializer('python')()
+    objects = queryset.iterator()
+    separator = ndjson and '\n' or ', '
+    if not ndjson:
+        yield '['
+    first = True
+    while True:
+        chunk = list(islice(objects, chunk_size))
+        if not chunk:
+            break
+        data = separator.join([encoder.encode(obj) for obj
+                               in serializer.serialize(chunk, **options)])
+        if ndjson:
+            yield data + '\n'
+        elif first:
+            yield data
+        else:
+            yield separator + data
+        first = False
+    if not ndjson:
+        yield ']'
+
+class FastJsonResponse(JsonResponse):
+    """
+    A JsonResponse serializing querysets through a per-model plan that reads
+    rows with ``values_list`` (see djutils.http.serializers). Accepts the
+    ``fields`` and ``exclude`` options.
+    """
+    def _serialize(self, object):
+        if isinstance(object, QuerySet):
+            return serialize_json(object, **self.options)
+        return super(FastJsonResponse, self)._serialize(object)
+
+class StreamingJsonResponse(JsonResponse):
+    """
+    A JsonResponse that streams querysets instead of building the whole
+    document in memory (see iter_json). Other objects are serialized as by
+    JsonResponse. With ``fast`` the objects are serialized through the
+    plans of djutils.http.serializers.
+    """
+    def __init__(self, object, chunk_size=100, ndjson=False, fast=False,
+                 **options):
+        self.chunk_size = chunk_size
+        self.ndjson = ndjson
+        self.fast = fast
+        if ndjson:
+            self.mimetype = 'application/x-ndjson'
+        super(StreamingJsonResponse, self).__init__(object, **options)
+
+    def _serialize(self, object):
+        if not isinstance(object, QuerySet):
+            return super(StreamingJsonResponse, self)._serialize(object)
+        if self.fast:
+            plan = get_plan(object.model, **self.options)
+            return plan.iter_json(object, self.chunk_size, self.ndjson)
+        return iter_json(object, self.chunk_size, self.ndjson, **self.options)
+
 class XmlResponse(SerializedResponse):
     format = 'xml'
 
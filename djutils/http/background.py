@@ -0,0 +1,162 @@
+"""
+Responses running their database work on a bounded pool of threads.
+
+Django has no asynchronous views, so instead of freeing the worker these
+responses overlap and bound the work: querysets are read and serialized
+one chunk per task on one of HTTP_DB_WORKERS threads (4 by default), at
+most ``prefetch`` chunks ahead of the request thread while it compresses
+and writes the previous ones. No pool thread waits for a slow client, and
+the pool caps the number of concurrent queries however many requests are
+being served. Every task closes its database connection when it is done.
+"""
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.serializers import get_serializer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.utils import simplejson
+
+from djutils.http import StreamingJsonResponse
+from djutils.http.serializers import get_plan
+from djutils.threadpool import ThreadPool
+
+DB_WORKERS = getattr(settings, 'HTTP_DB_WORKERS', 4)
+DB_QUEUE = getattr(settings, 'HTTP_DB_QUEUE', 100)
+TIMEOUT = getattr(settings, 'HTTP_DB_TIMEOUT', 60)
+
+db_pool = ThreadPool(DB_WORKERS, DB_QUEUE, TIMEOUT)
+
+def _closing(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connection.close()
+
+class PrefetchIterator(object):
+    """
+    Iterates over ``fetch(0)``, ``fetch(1)``, ... until it returns None.
+    Each call is a task of ``pool``, submitted when the iterator is
+    consumed, with at most ``prefetch`` of them in flight. Exceptions raised
+    by ``fetch`` are re-raised in the consuming thread.
+    """
+    def __init__(self, fetch, prefetch=2, pool=None, timeout=None):
+        self.fetch = fetch
+        self.prefetch = max(prefetch, 1)
+        self.pool = pool or db_pool
+        self.timeout = timeout or TIMEOUT
+        self._pending = deque()
+        self._next_index = 0
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def _submit(self):
+        while not self._closed and len(self._pending) < self.prefetch:
+            self._pending.append(self.pool.apply_async(_closing, self.fetch,
+                                                       self._next_index))
+            self._next_index += 1
+
+    def next(self):
+        self._submit()
+        if not self._pending:
+            raise StopIteration
+        try:
+            item = self._pending.popleft().get(self.timeout)
+        except:
+            self.close()
+            raise
+        if item is None:
+            self.close()
+            raise StopIteration
+        return item
+
+    def close(self):
+        # tasks in flight run to completion, their results are dropped
+        self._closed = True
+        self._pending.clear()
+
+def _json_document(chunks, ndjson=False):
+    try:
+        if ndjson:
+            for chunk in chunks:
+                yield chunk + '\n'
+            return
+        yield '['
+        separator = ''
+        for chunk in chunks:
+            yield separator + chunk
+            separator = ', '
+        yield ']'
+    finally:
+        chunks.close()
+
+class BackgroundJsonResponse(StreamingJsonResponse):
+    """
+    A StreamingJsonResponse whose querysets are read and serialized on the
+    database pool, one ``chunk_size`` chunk per task and at most
+    ``prefetch`` chunks ahead of the response. The primary keys of the
+    queryset are read first, in its ordering (by primary key if it has
+    none), and every chunk is then selected by its keys, so no row is
+    repeated or skipped when the table changes during the response.
+    """
+    def __init__(self, object, prefetch=2, **options):
+        self.prefetch = prefetch
+        super(BackgroundJsonResponse, self).__init__(object, **options)
+
+    def _encode_chunk(self, queryset):
+        if self.fast:
+            plan = get_plan(queryset.model, **self.options)
+            objects = list(plan.iter_objects(queryset, self.chunk_size))
+            encode = simplejson.JSONEncoder().encode
+        else:
+            objects = get_serializer('python')().serialize(list(queryset),
+                                                           **self.options)
+            encode = DjangoJSONEncoder().encode
+        if not objects:
+            return None
+        return (self.ndjson and '\n' or ', ').join([encode(obj)
+                                                    for obj in objects])
+
+    def _serialize(self, object):
+        if not isinstance(object, QuerySet):
+            return super(BackgroundJsonResponse, self)._serialize(object)
+        size = self.chunk_size
+        if object.query.can_filter():
+            if not object.ordered:
+                object = object.order_by('pk')
+            pks = []
+            lock = threading.Lock()
+            def fetch(index):
+                # the ordered primary keys are read once, by the first task;
+                # each chunk is then selected by its keys rather than with
+                # an OFFSET the database would have to scan
+                lock.acquire()
+                try:
+                    if not pks:
+                        pks.append(list(object.values_list('pk', flat=True)))
+                finally:
+                    lock.release()
+                chunk = pks[0][index * size:(index + 1) * size]
+                if not chunk:
+                    return None
+                return self._encode_chunk(object.filter(pk__in=chunk))
+        else:
+            # sliced querysets are bounded already; all() drops the result
+            # cache, which would turn the slices into lists
+            object = object.all()
+            def fetch(index):
+                return self._encode_chunk(object[index * size:
+                                                 (index + 1) * size])
+        return _json_document(PrefetchIterator(fetch, self.prefetch),
+                              self.ndjson)
+
+def run_query(func, *args, **kwargs):
+    """
+    Runs ``func(*args, **kwargs)`` on the database pool and returns its
+    result, waiting at most HTTP_DB_TIMEOUT seconds.
+    """
+    return db_pool.apply_async(_closing, func, *args, **kwargs).get(TIMEOUT)
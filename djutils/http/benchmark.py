@@ -0,0 +1,94 @@
+"""
+Timing helpers comparing the serialization paths of djutils.http.
+
+Usage::
+
+    from djutils.http.benchmark import benchmark_serializers
+    for name, seconds in benchmark_serializers(Post.objects.all()):
+        print name, seconds
+"""
+import threading
+import time
+
+from django.core.serializers import serialize
+
+from djutils.http import iter_json
+from djutils.http.compression import ENCODINGS, compress_chunks
+from djutils.http.serializers import serialize_json
+
+def _best_of(func, repeat):
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+def benchmark_serializers(queryset, repeat=3):
+    """
+    Returns (name, best time in seconds) pairs for serializing ``queryset``
+    to JSON with Django's serializer, the streaming serializer and the
+    precompiled plan.
+    """
+    return [
+        ('serialize', _best_of(lambda: serialize('json', queryset._clone()),
+                               repeat)),
+        ('iter_json', _best_of(lambda: ''.join(iter_json(queryset._clone())),
+                               repeat)),
+        ('plan', _best_of(lambda: serialize_json(queryset._clone()), repeat)),
+    ]
+
+def benchmark_compression(queryset, levels=(1, 6, 9), chunk_size=100):
+    """
+    Returns (encoding, level, compressed bytes, CPU seconds) tuples for
+    compressing the streamed JSON of ``queryset``, plus a first ('identity',
+    0, bytes, seconds) entry for the uncompressed output. The CPU time
+    includes serialization.
+    """
+    results = []
+    start = time.clock()
+    size = sum([len(chunk) for chunk in iter_json(queryset._clone(),
+                                                  chunk_size)])
+    results.append(('identity', 0, size, time.clock() - start))
+    for encoding in ENCODINGS:
+        for level in levels:
+            start = time.clock()
+            chunks = compress_chunks(iter_json(queryset._clone(), chunk_size),
+                                     encoding, level)
+            size = sum([len(chunk) for chunk in chunks])
+            results.append((encoding, level, size, time.clock() - start))
+    return results
+
+def benchmark_concurrency(views, make_request, connections=(1, 16, 64),
+                          requests=256):
+    """
+    Serves ``requests`` requests built by ``make_request()`` with each of
+    ``views`` (a list of (name, view) pairs) from as many threads as each
+    of ``connections``, reading the whole response body. Returns (name,
+    connections, requests per second) tuples.
+    """
+    results = []
+    for name, view in views:
+        for count in connections:
+            remaining = [requests]
+            lock = threading.Lock()
+            def client():
+                while True:
+                    lock.acquire()
+                    try:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    finally:
+                        lock.release()
+                    response = view(make_request())
+                    ''.join(response)
+                    response.close()
+            threads = [threading.Thread(target=client) for i in range(count)]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            results.append((name, count, requests / (time.time() - start)))
+    return results
@@ -0,0 +1,60 @@
+"""
+Streaming gzip/deflate compression of response content.
+
+The content is compressed chunk by chunk as it is produced, so a streamed
+response is never held in memory, compressed or not.
+"""
+import zlib
+
+ENCODINGS = ('gzip', 'deflate')
+
+# wbits selecting the gzip container and the zlib one (HTTP's "deflate")
+WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,
+}
+
+def choose_encoding(request, encodings=ENCODINGS):
+    """
+    Returns the first of ``encodings`` accepted by ``request`` according to
+    its Accept-Encoding header (honouring ``q=0``), or None.
+    """
+    accepted = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        params = item.strip().split(';')
+        coding = params[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    for encoding in encodings:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+def compress_chunks(chunks, encoding='gzip', level=6):
+    """
+    Compresses the strings of ``chunks`` into a single ``encoding`` stream,
+    yielding compressed data as soon as zlib produces some. ``chunks`` is
+    closed, if it can be, when the stream is.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, unicode):
+                chunk = chunk.encode('utf-8')
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
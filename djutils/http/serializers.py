@@ -0,0 +1,219 @@
+"""
+A fast path for serializing querysets to Django's JSON format.
+
+Django's serializers resolve the fields, instantiate every model, fetch
+every foreign key and build intermediate dicts for each object. A
+SerializationPlan decides all of that once per model: the field list, a
+conversion function per field type, foreign keys read as ids. Rows are then
+read with ``values_list`` and many-to-many ids with one query per field and
+chunk of objects.
+
+The output has the same structure and values as ``serialize('json', ...)``,
+but the order of the keys inside the objects isn't guaranteed to be the
+same.
+"""
+import datetime
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, models
+from django.db.models.query import EmptyQuerySet
+from django.utils import simplejson
+from django.utils.encoding import is_protected_type, smart_unicode
+
+def _datetime(value):
+    return value is not None and value.strftime('%Y-%m-%d %H:%M:%S') or None
+
+def _date(value):
+    return value is not None and value.strftime('%Y-%m-%d') or None
+
+def _time(value):
+    return value is not None and value.strftime('%H:%M:%S') or None
+
+def _decimal(value):
+    return value is not None and str(value) or None
+
+def _unicode(value):
+    if value is None or isinstance(value, (int, long, float, bool)):
+        return value
+    return smart_unicode(value)
+
+# Converters of the database values of the built-in fields. Subclasses
+# aren't included: they may convert the values they read (to_python).
+CONVERTERS = {
+    models.DateTimeField: _datetime,
+    models.DateField: _date,
+    models.TimeField: _time,
+    models.DecimalField: _decimal,
+    models.AutoField: None,
+    models.BooleanField: None,
+    models.NullBooleanField: None,
+    models.IntegerField: None,
+    models.BigIntegerField: None,
+    models.PositiveIntegerField: None,
+    models.PositiveSmallIntegerField: None,
+    models.SmallIntegerField: None,
+    models.FloatField: None,
+    models.CharField: _unicode,
+    models.TextField: _unicode,
+    models.SlugField: _unicode,
+    models.EmailField: _unicode,
+    models.URLField: _unicode,
+    models.IPAddressField: _unicode,
+    models.CommaSeparatedIntegerField: _unicode,
+    models.FilePathField: _unicode,
+    models.FileField: _unicode,
+    models.ImageField: _unicode,
+}
+
+def _protected(value):
+    # what DjangoJSONEncoder does with the values serializers keep as is
+    if isinstance(value, datetime.datetime):
+        return _datetime(value)
+    if isinstance(value, datetime.date):
+        return _date(value)
+    if isinstance(value, datetime.time):
+        return _time(value)
+    if isinstance(value, Decimal):
+        return _decimal(value)
+    return value
+
+class _Instance(object):
+    "Holds a single attribute for Field.value_to_string()."
+
+def _field_converter(field):
+    def convert(value):
+        # as the python serializer, from the value the model would hold
+        obj = _Instance()
+        setattr(obj, field.attname, field.to_python(value))
+        value = field._get_val_from_obj(obj)
+        if is_protected_type(value):
+            return _protected(value)
+        return field.value_to_string(obj)
+    return convert
+
+def _related_converter(field):
+    def convert(value):
+        value = field.to_python(value)
+        if is_protected_type(value):
+            return _protected(value)
+        return smart_unicode(value)
+    return convert
+
+class SerializationPlan(object):
+    def __init__(self, model, fields=None, exclude=None):
+        opts = model._meta
+        self.model = model
+        self.label = smart_unicode(opts)
+        self.fields = []
+        for field in opts.local_fields:
+            if not field.serialize or field is opts.pk or \
+                    not self._selected(field, fields, exclude):
+                continue
+            if field.rel is not None:
+                related = field.rel.get_related_field()
+                if type(related) in CONVERTERS:
+                    converter = CONVERTERS[type(related)]
+                else:
+                    converter = _related_converter(related)
+            elif type(field) in CONVERTERS:
+                converter = CONVERTERS[type(field)]
+            else:
+                converter = _field_converter(field)
+            self.fields.append((field.name, field.attname, converter))
+        self.columns = [opts.pk.attname] + [attname for name, attname, converter
+                                            in self.fields]
+        self.many_to_many = []
+        for field in opts.many_to_many:
+            if field.serialize and field.rel.through._meta.auto_created and \
+                    self._selected(field, fields, exclude):
+                self.many_to_many.append(field)
+
+    def _selected(self, field, fields, exclude):
+        if fields is not None and field.attname not in fields and \
+                field.name not in fields:
+            return False
+        if exclude is not None and (field.attname in exclude or
+                                    field.name in exclude):
+            return False
+        return True
+
+    def _related_ids(self, field, pks):
+        qn = connection.ops.quote_name
+        column, reverse = field.m2m_column_name(), field.m2m_reverse_name()
+        cursor = connection.cursor()
+        cursor.execute("SELECT %s, %s FROM %s WHERE %s IN (%s)" % (qn(column),
+            qn(reverse), qn(field.m2m_db_table()), qn(column),
+            ', '.join(['%s'] * len(pks))), pks)
+        related = {}
+        for pk, related_pk in cursor.fetchall():
+            related.setdefault(pk, []).append(_unicode(related_pk))
+        return related
+
+    def iter_objects(self, queryset, chunk_size=100):
+        """
+        Yields the dictionaries serialize('python', queryset) would return,
+        reading the rows with values_list.
+        """
+        if isinstance(queryset, EmptyQuerySet):
+            # EmptyQuerySet.values_list() queries the whole table
+            return
+        rows = queryset.values_list(*self.columns).iterator()
+        fields = self.fields
+        label = self.label
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            related = []
+            if self.many_to_many:
+                pks = [row[0] for row in chunk]
+                related = [(field.name, self._related_ids(field, pks))
+                           for field in self.many_to_many]
+            for row in chunk:
+                values = {}
+                for (name, attname, converter), value in zip(fields, row[1:]):
+                    if converter is not None:
+                        value = converter(value)
+                    values[name] = value
+                for name, ids in related:
+                    values[name] = ids.get(row[0], [])
+                yield {'pk': _unicode(row[0]), 'model': label, 'fields': values}
+
+    def iter_json(self, queryset, chunk_size=100, ndjson=False):
+        "Like djutils.http.iter_json, using the plan."
+        encode = simplejson.JSONEncoder().encode
+        separator = ndjson and '\n' or ', '
+        objects = self.iter_objects(queryset, chunk_size)
+        if not ndjson:
+            yield '['
+        first = True
+        while True:
+            chunk = list(islice(objects, chunk_size))
+            if not chunk:
+                break
+            data = separator.join([encode(obj) for obj in chunk])
+            if ndjson:
+                yield data + '\n'
+            elif first:
+                yield data
+            else:
+                yield separator + data
+            first = False
+        if not ndjson:
+            yield ']'
+
+_plans = {}
+
+def get_plan(model, fields=None, exclude=None):
+    "Returns the SerializationPlan of ``model``, building it the first time."
+    key = (model, fields and tuple(fields), exclude and tuple(exclude))
+    try:
+        return _plans[key]
+    except KeyError:
+        plan = _plans[key] = SerializationPlan(model, fields, exclude)
+        return plan
+
+def serialize_json(queryset, fields=None, exclude=None):
+    "Serializes ``queryset`` to a JSON string through its plan."
+    return ''.join(get_plan(queryset.model, fields, exclude).iter_json(queryset))
@@ -0,0 +1,36 @@
+from django.contrib.auth.models import Group, User
+from django.test.client import RequestFactory
+from django.utils import unittest
+
+from djutils.http import JsonResponse
+from djutils.http.validators import EMPTY_ETAG, queryset_validator
+
+class QuerysetValidatorTest(unittest.TestCase):
+    def test_empty_result_set(self):
+        # filter(pk__in=[]) can't be turned into SQL: EmptyResultSet
+        validator = queryset_validator('date_joined')
+        queryset = User.objects.filter(pk__in=[])
+        self.assertEqual(validator(queryset), (EMPTY_ETAG, None))
+        request = RequestFactory().get('/')
+        response = JsonResponse(queryset, request=request, validator=validator)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, '[]')
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        response = JsonResponse(queryset, request=request, validator=validator)
+        self.assertEqual(response.status_code, 304)
+
+    def test_non_ascii_filter(self):
+        validator = queryset_validator()
+        # Query.__str__ would fail to encode the parameter
+        etag = validator(Group.objects.filter(name=u'caf\xe9'))[0]
+        self.assertNotEqual(etag, validator(Group.objects.filter(name='cafe'))[0])
+
+    def test_invalidation(self):
+        validator = queryset_validator()
+        queryset = Group.objects.filter(name='validation')
+        etag = validator(queryset)[0]
+        Group.objects.create(name='validation')
+        try:
+            self.assertNotEqual(validator(queryset)[0], etag)
+        finally:
+            queryset.delete()
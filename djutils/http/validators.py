@@ -0,0 +1,101 @@
+"""
+Conditional GET support for the responses of djutils.http.
+
+A validator is a callable taking the object to serialize and returning an
+``(etag, last_modified)`` pair, where ``last_modified`` is a datetime and
+either may be None. It should be much cheaper than serializing the object,
+so responses can answer ``If-None-Match``/``If-Modified-Since`` with a 304
+before doing any serialization work::
+
+    def posts(request):
+        return JsonResponse(Post.objects.filter(published=True),
+                            request=request,
+                            validator=queryset_validator('updated'))
+"""
+import time
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.db.models.query import EmptyQuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils.http import parse_etags, parse_http_date_safe
+
+from djutils.cache.tags import get_generations, model_tag, register_model_tags
+
+VALIDATOR_TIMEOUT = getattr(settings, 'HTTP_VALIDATOR_TIMEOUT', 300)
+
+# ETag of the querysets that can't match any row
+EMPTY_ETAG = md5('empty').hexdigest()
+
+register_model_tags('djutils.http')
+
+def not_modified(request, etag=None, last_modified=None):
+    """
+    Returns True if ``request`` is a GET or HEAD whose conditional headers
+    match ``etag`` or ``last_modified``. If-None-Match takes precedence over
+    If-Modified-Since.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        if etag is None:
+            return False
+        etags = parse_etags(if_none_match)
+        return etag in etags or '*' in etags
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since and last_modified is not None:
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and \
+            timestamp(last_modified) <= if_modified_since
+    return False
+
+def timestamp(value):
+    "Returns the POSIX timestamp of the (local time) datetime ``value``."
+    return int(time.mktime(value.timetuple()))
+
+def queryset_validator(date_field=None, timeout=None):
+    """
+    Returns a validator for querysets, computed with a single aggregate
+    query: the ETag hashes the query, the number of rows and the latest
+    ``date_field``, which is also used as Last-Modified.
+
+    Validators are cached per query for ``timeout`` seconds
+    (HTTP_VALIDATOR_TIMEOUT, 5 minutes by default) and invalidated whenever
+    an instance of the queryset's model is saved or deleted by any process
+    with djutils in INSTALLED_APPS. Changes to other models the query
+    depends on are only seen when the cached validator expires.
+    """
+    if timeout is None:
+        timeout = VALIDATOR_TIMEOUT
+    def validator(queryset):
+        if isinstance(queryset, EmptyQuerySet):
+            return EMPTY_ETAG, None
+        try:
+            sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        except EmptyResultSet:
+            # e.g. filter(pk__in=[])
+            return EMPTY_ETAG, None
+        signature = md5(repr((' '.join(sql.split()), params, date_field)))
+        tag = model_tag(queryset.model, 'djutils.http')
+        generation, = get_generations([tag])
+        key = 'djutils.http.validator.%s.%s' % (signature.hexdigest(),
+                                                generation)
+        result = cache.get(key)
+        if result is None:
+            aggregates = {'count': Count('pk')}
+            if date_field is not None:
+                aggregates['last'] = Max(date_field)
+            values = queryset.aggregate(**aggregates)
+            last_modified = values.get('last')
+            signature.update('|%s|%s' % (values['count'], last_modified))
+            result = (signature.hexdigest(), last_modified)
+            cache.set(key, result, timeout)
+        return result
+    return validator
@@ -0,0 +1,53 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model
+
+from djutils.cache.registry import cacheable_methods, warm
+
+class Command(BaseCommand):
+    help = ("Computes the values of @cacheable methods ahead of traffic. "
+            "Warms every registered method without arguments by default.")
+    args = '[app_label.Model[.method] ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', dest='chunk_size', type='int', default=500,
+            help='Number of objects read and written at a time.'),
+        make_option('--workers', dest='workers', type='int', default=4,
+            help='Number of threads computing the values.'),
+        make_option('--rate', dest='rate', type='float', default=None,
+            help='Maximum number of keys written per second.'),
+        make_option('--force', action='store_true', dest='force', default=False,
+            help='Recompute the values already in the cache.'),
+    )
+
+    def handle(self, *labels, **options):
+        verbosity = int(options.get('verbosity', 1))
+        methods = []
+        if not labels:
+            methods = cacheable_methods()
+        for label in labels:
+            bits = label.split('.')
+            if len(bits) not in (2, 3):
+                raise CommandError("Enter app_label.Model or "
+                                   "app_label.Model.method, not %r." % label)
+            model = get_model(bits[0], bits[1])
+            if model is None:
+                raise CommandError("Unknown model: %s" % label)
+            found = [entry for entry in cacheable_methods([model])
+                     if len(bits) == 2 or entry[1] == bits[2]]
+            if not found:
+                raise CommandError("No cacheable method found for %s" % label)
+            methods.extend(found)
+        for model, name, method in methods:
+            label = '%s.%s.%s' % (model._meta.app_label,
+                                  model._meta.object_name, name)
+            def progress(seen, written, elapsed):
+                if verbosity > 1:
+                    print "%s: %d objects, %d keys (%.0f keys/s)" % (label,
+                        seen, written, written / max(elapsed, 0.001))
+            seen, written, elapsed = warm(method,
+                model._default_manager.all(), options['chunk_size'],
+                options['workers'], options['rate'], options['force'], progress)
+            if verbosity > 0:
+                print "%s: %d objects, %d keys in %.1fs (%.0f keys/s)" % (label,
+                    seen, written, elapsed, written / max(elapsed, 0.001))
@@ -1,6 +1,12 @@
 # http://www.djangosnippets.org/snippets/1153/
 
+from djutils.routes import get_route_index
+
 class ActiveViewMiddleware(object):
+    def __init__(self):
+        # build the index used by {% ifactive %} before serving requests
+        get_route_index()
+
     def process_view(self, request, view_func, view_args, view_kwargs):
         """
         Records the view function used on this request and its *args and **kwargs.
@@ -0,0 +1,5 @@
+# Loaded with the models of INSTALLED_APPS: registers the model tags of
+# cached counts and HTTP validators, so every process with djutils installed
+# invalidates them when it saves or deletes instances.
+import djutils.http.validators
+import djutils.pagination.counts
@@ -0,0 +1,175 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``OFFSET n``, pages are selected by comparing the ordering
+columns with the values of the last (or first) row of the previous page, so
+with an index on the ordering every page costs the same as the first one,
+and no ``COUNT(*)`` is needed. The position is passed around as an opaque
+cursor token, signed with SECRET_KEY::
+
+    paginator = KeysetPaginator(Post.objects.all(), 20, ('-created', 'pk'))
+    page = paginator.page(request.GET.get('cursor'))
+
+The ordering fields must be non-null fields of the model itself, and should
+end with a unique one; the primary key is appended when it isn't part of
+the ordering already.
+"""
+import base64
+import datetime
+from decimal import Decimal
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils import simplejson
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from djutils.pagination.counts import cached_count
+
+class InvalidCursor(InvalidPage):
+    pass
+
+def _encode_value(value):
+    # unlike DjangoJSONEncoder, keep the microseconds: they are part of the key
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S') + '.%06d' % value.microsecond
+    if isinstance(value, (datetime.date, datetime.time, Decimal)):
+        return unicode(value)
+    return value
+
+class KeysetPage(object):
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Keyset page of %s objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_cursor(self):
+        "Returns the cursor of the next page, or None."
+        if self._has_next and self.object_list:
+            return self.paginator.cursor(self.object_list[-1])
+        return None
+
+    def previous_cursor(self):
+        "Returns the cursor of the previous page, or None."
+        if self._has_previous and self.object_list:
+            return self.paginator.cursor(self.object_list[0], previous=True)
+        return None
+
+class KeysetPaginator(object):
+    """
+    Pages ``queryset`` by ``per_page`` objects along ``ordering`` (by
+    default the ordering of the queryset's model).
+    """
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        opts = queryset.model._meta
+        if ordering is None:
+            ordering = queryset.query.order_by or opts.ordering
+        ordering = list(ordering)
+        names = [name.lstrip('-') for name in ordering]
+        if 'pk' not in names and opts.pk.name not in names:
+            ordering.append('pk')
+        self.ordering = ordering
+        self.fields = []
+        for name in ordering:
+            field_name = name.lstrip('-')
+            if field_name == 'pk':
+                field = opts.pk
+            else:
+                field = opts.get_field(field_name)
+            self.fields.append((field_name, field, name.startswith('-')))
+        self._salt = 'djutils.pagination.%s.%s' % (opts.db_table,
+                                                   ','.join(ordering))
+
+    def _sign(self, data):
+        return salted_hmac(self._salt, data).hexdigest()
+
+    def cursor(self, obj, previous=False):
+        """
+        Returns the token of the position after ``obj``, or before it if
+        ``previous``.
+        """
+        values = [_encode_value(getattr(obj, field.attname))
+                  for name, field, descending in self.fields]
+        data = base64.urlsafe_b64encode(simplejson.dumps([previous and 1 or 0,
+                                                          values]))
+        return '%s.%s' % (data.rstrip('='), self._sign(data.rstrip('=')))
+
+    def decode_cursor(self, token):
+        "Returns ``(previous, values)`` for ``token``, or raises InvalidCursor."
+        try:
+            data, signature = str(token).rsplit('.', 1)
+        except (ValueError, UnicodeEncodeError):
+            raise InvalidCursor('Malformed cursor')
+        if not constant_time_compare(signature, self._sign(data)):
+            raise InvalidCursor('Bad cursor signature')
+        try:
+            previous, values = simplejson.loads(
+                base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)))
+            values = [field.to_python(value) for value, (name, field,
+                      descending) in zip(values, self.fields)]
+        except Exception:
+            raise InvalidCursor('Malformed cursor')
+        return bool(previous), values
+
+    def _after(self, values, reverse=False):
+        # (a, b, c) > (x, y, z) as a OR of ANDs, each column compared in
+        # its own direction
+        condition = Q()
+        equal = {}
+        for (name, field, descending), value in zip(self.fields, values):
+            lookup = (descending != reverse) and 'lt' or 'gt'
+            term = Q(**{'%s__%s' % (name, lookup): value})
+            if equal:
+                term &= Q(**equal)
+            condition |= term
+            equal['%s__exact' % name] = value
+        return condition
+
+    def page(self, cursor=None):
+        """
+        Returns the KeysetPage at ``cursor``, the first page if it is None.
+        """
+        queryset = self.queryset
+        previous = False
+        if cursor:
+            previous, values = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._after(values, previous))
+        if previous:
+            ordering = [name.startswith('-') and name[1:] or '-' + name
+                        for name in self.ordering]
+        else:
+            ordering = self.ordering
+        objects = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if previous:
+            objects.reverse()
+            return KeysetPage(objects, self, True, more)
+        return KeysetPage(objects, self, more, bool(cursor))
+
+    def count(self, timeout=None):
+        """
+        Returns the number of objects, cached for ``timeout`` seconds
+        (see djutils.pagination.counts.cached_count).
+        """
+        return cached_count(self.queryset, timeout)
@@ -0,0 +1,129 @@
+"""
+Counting strategies for paginators.
+
+``cached_count`` caches exact counts per query for PAGINATION_COUNT_TIMEOUT
+seconds, and forgets them as soon as an instance of the queryset's model is
+saved or deleted by any process with djutils in INSTALLED_APPS (changes to
+other models the query depends on are only seen when the count expires).
+
+``estimated_count`` asks the planner of PostgreSQL or MySQL for its row
+estimate, and falls back to the cached exact count on other backends or
+when the estimate is below PAGINATION_ESTIMATE_THRESHOLD (1000 by default),
+where counting is cheap and an estimate would be noticeably wrong.
+"""
+import re
+
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.query import EmptyQuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+
+from djutils.cache.tags import get_generations, model_tag, register_model_tags
+
+COUNT_TIMEOUT = getattr(settings, 'PAGINATION_COUNT_TIMEOUT', 600)
+ESTIMATE_THRESHOLD = getattr(settings, 'PAGINATION_ESTIMATE_THRESHOLD', 1000)
+
+EXACT, CACHED, ESTIMATED = 'exact', 'cached', 'estimated'
+
+register_model_tags('djutils.pagination')
+
+def _sql(queryset):
+    return queryset.query.get_compiler(queryset.db).as_sql()
+
+def count_key(queryset):
+    """
+    Returns the cache key of the count of ``queryset``. Raises
+    EmptyResultSet if the queryset can't match any row.
+    """
+    sql, params = _sql(queryset)
+    signature = md5(repr((' '.join(sql.split()), params)))
+    generation, = get_generations([model_tag(queryset.model,
+                                             'djutils.pagination')])
+    return 'djutils.pagination.count.%s.%s' % (signature.hexdigest(),
+                                               generation)
+
+def cached_count(queryset, timeout=None):
+    "Returns ``queryset.count()``, cached for ``timeout`` seconds."
+    if isinstance(queryset, EmptyQuerySet):
+        return 0
+    if timeout is None:
+        timeout = COUNT_TIMEOUT
+    try:
+        key = count_key(queryset)
+    except EmptyResultSet:
+        # e.g. filter(pk__in=[])
+        return 0
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+_postgresql_rows = re.compile(r'rows=(\d+)')
+
+def planner_estimate(queryset):
+    """
+    Returns the number of rows of ``queryset`` estimated by the database's
+    planner, or None if the backend doesn't provide one.
+    """
+    connection = connections[queryset.db]
+    vendor = getattr(connection, 'vendor', None)
+    if vendor not in ('postgresql', 'mysql'):
+        return None
+    try:
+        sql, params = _sql(queryset)
+    except EmptyResultSet:
+        return 0
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN ' + sql, params)
+    if vendor == 'postgresql':
+        match = _postgresql_rows.search(cursor.fetchone()[0])
+        return match and int(match.group(1)) or None
+    columns = [column[0] for column in cursor.description]
+    row = cursor.fetchone()
+    if row is None or 'rows' not in columns:
+        return None
+    return row[columns.index('rows')]
+
+def estimated_count(queryset, threshold=None, timeout=None):
+    """
+    Returns ``(count, estimated)``: the planner's estimate of the number of
+    rows and True, or the cached exact count and False.
+    """
+    if threshold is None:
+        threshold = ESTIMATE_THRESHOLD
+    if not isinstance(queryset, EmptyQuerySet):
+        estimate = planner_estimate(queryset)
+        if estimate is not None and estimate >= threshold:
+            return estimate, True
+    return cached_count(queryset, timeout), False
+
+class CountingPaginator(Paginator):
+    """
+    A Paginator counting its object list with one of the strategies:
+    ``'exact'`` (as Paginator), ``'cached'`` or ``'estimated'``. The
+    ``estimated`` attribute tells whether ``count`` is an estimate; the last
+    pages of an estimated paginator may then be empty or missing.
+    """
+    def __init__(self, object_list, per_page, strategy=CACHED, **kwargs):
+        super(CountingPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.strategy = strategy
+        self.estimated = False
+
+    def _get_count(self):
+        if self._count is None:
+            if self.strategy == EXACT or not hasattr(self.object_list, 'query'):
+                return super(CountingPaginator, self)._get_count()
+            if self.strategy == ESTIMATED:
+                self._count, self.estimated = estimated_count(self.object_list)
+            else:
+                self._count = cached_count(self.object_list)
+        return self._count
+    count = property(_get_count)
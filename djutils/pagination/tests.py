@@ -0,0 +1,31 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.utils import unittest
+
+from djutils.pagination import KeysetPaginator
+from djutils.pagination.counts import CountingPaginator, cached_count, \
+    count_key
+
+class EmptyResultSetTest(unittest.TestCase):
+    # filter(pk__in=[]) can't be turned into SQL: EmptyResultSet
+    def test_cached_count(self):
+        self.assertEqual(cached_count(User.objects.filter(pk__in=[])), 0)
+
+    def test_paginators(self):
+        queryset = User.objects.filter(pk__in=[])
+        for strategy in ('cached', 'estimated'):
+            paginator = CountingPaginator(queryset, 10, strategy=strategy)
+            self.assertEqual(paginator.count, 0)
+            self.assertFalse(paginator.estimated)
+        self.assertEqual(KeysetPaginator(queryset, 10).count(), 0)
+
+class InvalidationTest(unittest.TestCase):
+    def tearDown(self):
+        Group.objects.filter(name='invalidation').delete()
+
+    def test_save_without_counting(self):
+        # as if another process had cached the count
+        queryset = Group.objects.all()
+        cache.set(count_key(queryset), 42)
+        Group.objects.create(name='invalidation')
+        self.assertEqual(cached_count(queryset), queryset.count())
@@ -0,0 +1,78 @@
+"""
+An index of the url patterns of each urlconf, mapping pattern names and
+dotted paths of views to ``(view function, default kwargs)``.
+
+Indexes are built in full, under a lock, the first time a urlconf is used
+(ActiveViewMiddleware builds the one of ROOT_URLCONF when it is loaded), and
+rebuilt when Django's resolver for the urlconf is replaced, e.g. after
+``clear_url_caches()``. Lookups are then a dict access.
+"""
+import threading
+
+from django.core.urlresolvers import RegexURLResolver, get_resolver
+
+class RouteIndex(object):
+    def __init__(self, resolver):
+        self.resolver = resolver
+        self.routes = self._build(resolver, {})
+
+    def _build(self, resolver, default_args):
+        """
+        Recursively generates a map of
+        (pattern name or path to view function) -> (view function, default args)
+        """
+        routes = {}
+        for pattern in resolver.url_patterns:
+            pattern_args = default_args.copy()
+            if isinstance(pattern, RegexURLResolver):
+                pattern_args.update(pattern.default_kwargs)
+                routes.update(self._build(pattern, pattern_args))
+            else:
+                pattern_args.update(pattern.default_args)
+                if pattern.name is not None:
+                    routes[pattern.name] = (pattern.callback, pattern_args)
+                # HACK: Accessing private attribute of RegexURLPattern
+                callback_str = getattr(pattern, '_callback_str', None)
+                if callback_str is not None:
+                    routes[callback_str] = (pattern.callback, pattern_args)
+        return routes
+
+    def lookup(self, view_name):
+        """
+        Returns the view function and default kwargs of ``view_name``, a
+        path to a view or a name of a urlpattern.
+        """
+        try:
+            return self.routes[view_name]
+        except KeyError:
+            raise KeyError("%s does not match any urlpatterns" % view_name)
+
+_indexes = {}
+_lock = threading.Lock()
+
+def get_route_index(urlconf=None):
+    "Returns the RouteIndex of ``urlconf`` (ROOT_URLCONF if None)."
+    resolver = get_resolver(urlconf)
+    index = _indexes.get(urlconf)
+    if index is not None and index.resolver is resolver:
+        return index
+    _lock.acquire()
+    try:
+        index = _indexes.get(urlconf)
+        if index is None or index.resolver is not resolver:
+            index = RouteIndex(resolver)
+            _indexes[urlconf] = index
+        return index
+    finally:
+        _lock.release()
+
+def lookup_view(view_name, urlconf=None):
+    "Shortcut for get_route_index(urlconf).lookup(view_name)."
+    return get_route_index(urlconf).lookup(view_name)
+
+def clear_route_indexes():
+    _lock.acquire()
+    try:
+        _indexes.clear()
+    finally:
+        _lock.release()
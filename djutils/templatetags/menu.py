@@ -2,10 +2,12 @@ from django import template
 from django.conf import settings
 from django.utils.encoding import smart_str
 from django.core.urlresolvers import reverse
-from django.utils.translation import gettext
-from django.core.urlresolvers import get_callable, RegexURLResolver, get_resolver
+from django.utils.translation import gettext, get_language
+from django.core.urlresolvers import get_callable, get_urlconf
 from django.template import loader, Node, NodeList, TextNode, TemplateSyntaxError, Library, resolve_variable
 
+from djutils.routes import get_route_index, lookup_view
+
 register = template.Library()
 
 # Based on http://www.djangosnippets.org/snippets/347/
@@ -14,9 +16,15 @@ class SimpleMenu(object):
     """
     Stores a tree-like menu hierarchy, and renders it up to a chosen item
     on request.
+
+    The menus are compiled once per (language, urlconf), with translated
+    labels and reversed urls, and rendered menus are cached. Both are
+    rebuilt when the menus (MENU_ITEMS by default) are replaced or the route
+    index of the urlconf is rebuilt (see djutils.routes), or after
+    invalidate().
     """
 
-    def __init__(self, menulist):
+    def __init__(self, menulist=None):
         """
         Initializes the class.
         
@@ -24,6 +32,7 @@ class SimpleMenu(object):
         label; the corresponding value is a list of (item_label, urlname)
         pairs.  The 'urlname' is then looked up in the URL configuration in
         order to correctly render the matching link. (See example below.)
+        If it is None, the MENU_ITEMS setting is used.
 
         Example MENU_ITEMS setting::
 
@@ -38,7 +47,53 @@ class SimpleMenu(object):
                 ),
             }
         """
-        self.menus = menulist
+        self._menus = menulist
+        self.invalidate()
+
+    def _get_menus(self):
+        if self._menus is None:
+            return settings.MENU_ITEMS
+        return self._menus
+    menus = property(_get_menus)
+
+    def invalidate(self):
+        "Forgets the compiled menus, rendered menus and templates."
+        self._compiled = {}
+        self._templates = {}
+
+    def get_template(self, name):
+        """
+        Returns the template ``name``, or None if it doesn't exist. Both
+        outcomes are remembered.
+        """
+        try:
+            return self._templates[name]
+        except KeyError:
+            try:
+                found = loader.get_template(name)
+            except template.TemplateDoesNotExist:
+                found = None
+            self._templates[name] = found
+            return found
+
+    def compile(self):
+        """
+        Returns the menus for the current language and urlconf, as a dict
+        of menu label -> list of (translated label, url, urlname).
+        """
+        urlconf = get_urlconf()
+        key = (get_language(), urlconf)
+        menus = self.menus
+        index = get_route_index(urlconf)
+        entry = self._compiled.get(key)
+        if entry is None or entry[0] is not menus or entry[1] is not index:
+            compiled = {}
+            for menu_name, items in menus.items():
+                compiled[menu_name] = [(gettext(label),
+                                        reverse(view, urlconf=urlconf), view)
+                                       for label, view in items]
+            entry = self._compiled[key] = (menus, index, compiled, {})
+        return entry
 
     def render(self, menu_name, depth=0, active=None):
         """
@@ -66,13 +121,19 @@ class SimpleMenu(object):
                 {% endfor %}
             </ul>
         """
-        item_list = []
-        for label, view in self.menus[menu_name]:
-            item_list.append((gettext(label), reverse(view), view == active))
+        menus, index, compiled, rendered = self.compile()
+        try:
+            return rendered[(menu_name, depth, active)]
+        except KeyError:
+            pass
+        item_list = [(label, url, view == active)
+                     for label, url, view in compiled[menu_name]]
         context = template.Context({'item_list': item_list, 'depth': depth})
-        return loader.get_template('menu.html').render(context)
+        html = self.get_template('menu.html').render(context)
+        rendered[(menu_name, depth, active)] = html
+        return html
 
-menu = SimpleMenu(settings.MENU_ITEMS)
+menu = SimpleMenu()
 
 class MenuNode(template.Node):
     """
@@ -95,31 +156,25 @@ class MenuNode(template.Node):
         exists, as active.
     """
     def __init__(self, menu_path):
-        self.menu_path = menu_path
+        # Strip any single quotes from the string edges
+        self.menu_path = [s.rstrip('"\'').lstrip('"\'') for s in menu_path]
 
     def render(self, context):
-        # Item = (item, follower)
-        for i in range(len(self.menu_path)):
-            # Strip any single quotes from the string edges
-            self.menu_path = [s.rstrip('"\'').lstrip('"\'')
-                for s in self.menu_path]
-        self.context = context
         # Render each couple: (1,2), (2,3), (3,4), ...
-        return ''.join([self._render_menu(self.menu_path[index],    
+        return ''.join([self._render_menu(context, self.menu_path[index],
             active=self.menu_path[index+1], depth=index)
             for index in range(len(self.menu_path)-1)])
 
-    def _render_menu(self, menu_name, active=None, depth=None):
+    def _render_menu(self, context, menu_name, active=None, depth=None):
         """
         If the menu has its own template, then use the template.  Otherwise,
         ask its class to do the rendering.
         """
-        try:
-            menu_template = loader.get_template('menu/%s.html' % menu_name)
-            self.context['active'] = active
-            return menu_template.render(self.context)
-        except template.TemplateDoesNotExist:
+        menu_template = menu.get_template('menu/%s.html' % menu_name)
+        if menu_template is None:
             return menu.render(menu_name, depth=depth, active=active)
+        context['active'] = active
+        return menu_template.render(context)
 
 def do_menu(parser, token):
     menu_path = token.split_contents()
@@ -189,6 +244,7 @@ class ActiveNode(Node):
         self.view_name = view_name
         self.args = args
         self.kwargs = kwargs
+        self.has_args = bool(args or kwargs)
         self.active_nodes = active_nodes
         self.inactive_nodes = inactive_nodes
     
@@ -196,74 +252,38 @@ class ActiveNode(Node):
 
         request = resolve_variable(self.request_var, context)
 
-        view, default_args = _get_view_and_default_args(self.view_name)        
+        view, default_args = _get_view_and_default_args(self.view_name,
+            getattr(request, 'urlconf', None))
                 
-        if getattr(request, '_view_func', None) is view:        
-            
-            resolved_args = [arg.resolve(context) for arg in self.args]                                               
-            if request._view_args == resolved_args:
-            
-                resolved_kwargs = dict([(k, v.resolve(context)) for k, v in self.kwargs.items()])
-                resolved_kwargs.update(default_args)
-                                               
-                if request._view_kwargs == resolved_kwargs:
-                    return self.active_nodes.render(context)
+        if getattr(request, '_view_func', None) is view and \
+                self._args_match(request, default_args, context):
+            return self.active_nodes.render(context)
         
         if self.inactive_nodes is not None:    
             return self.inactive_nodes.render(context)
         else:
             return ''
 
-def _get_patterns_map(resolver, default_args=None):
-    """
-    Recursively generates a map of 
-    (pattern name or path to view function) -> (view function, default args)    
-    """
-
-    patterns_map = {}
-    
-    if default_args is None:
-        default_args = {}
-
-    for pattern in resolver.url_patterns:
-    
-        pattern_args = default_args.copy()
-    
-        if isinstance(pattern, RegexURLResolver):
-            pattern_args.update(pattern.default_kwargs)
-            patterns_map.update(_get_patterns_map(pattern, pattern_args))
-        else:
-            pattern_args.update(pattern.default_args)
-        
-            if pattern.name is not None:
-                patterns_map[pattern.name] = (pattern.callback, pattern_args)
-            
-            # HACK: Accessing private attribute of RegexURLPattern
-            callback_str = getattr(pattern, '_callback_str', None)
-            if callback_str is not None:    
-                patterns_map[pattern._callback_str] = (pattern.callback, pattern_args)
-        
-    return patterns_map    
-
-_view_name_cache = None
-
-def _get_view_and_default_args(view_name):
+    def _args_match(self, request, default_args, context):
+        if not self.has_args:
+            # Fast path: nothing to resolve
+            return not request._view_args and \
+                request._view_kwargs == default_args
+        resolved_args = [arg.resolve(context) for arg in self.args]
+        if request._view_args != resolved_args:
+            return False
+        resolved_kwargs = dict([(k, v.resolve(context)) for k, v in self.kwargs.items()])
+        resolved_kwargs.update(default_args)
+        return request._view_kwargs == resolved_kwargs
+
+def _get_view_and_default_args(view_name, urlconf=None):
     """
     Given view_name (a path to a view or a name of a urlpattern,
     returns the view function and a dict containing any default kwargs
     that are specified in the urlconf for that view.
     """
+    return lookup_view(view_name, urlconf)
 
-    global _view_name_cache
-    
-    if _view_name_cache is None:
-        _view_name_cache = _get_patterns_map(get_resolver(None))               
-        
-    try:
-        return _view_name_cache[view_name]
-    except KeyError:
-        raise KeyError("%s does not match any urlpatterns" % view_name)   
-    
 def _parse_url_args(parser, bits):
     """
     Parses URL parameters in the same way as the {% url %} tag.    
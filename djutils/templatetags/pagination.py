@@ -1,4 +1,5 @@
 from django import template
+from django.utils.translation import ungettext
 
 register = template.Library()
 
@@ -14,8 +15,15 @@ def paginator(context, adjacent_pages=2):
 
     You must add 'django.core.context_processors.request' to your
     TEMPLATE_CONTEXT_PROCESSORS setting.
+
+    When ``hits`` comes from a djutils.pagination.counts.CountingPaginator
+    with estimated counts, ``hits_estimated`` is True and ``hits_label``
+    reads "about N results".
     """
     request = context['request']
+    hits = context.get('hits')
+    hits_estimated = context.get('hits_estimated',
+        getattr(context.get('paginator'), 'estimated', False))
     qs = list()
     for k, v in request.GET.items():
         if k == 'page':
@@ -31,7 +39,9 @@ def paginator(context, adjacent_pages=2):
     return {
         'paginator_url': paginator_url,
         'is_paginated': context['is_paginated'],
-        'hits': context.get('hits'),
+        'hits': hits,
+        'hits_estimated': hits_estimated,
+        'hits_label': hits_label(hits, hits_estimated),
         'results_per_page': context.get('results_per_page'),
         'page': page,
         'pages': pages,
@@ -45,3 +55,51 @@ def paginator(context, adjacent_pages=2):
     }
 
 register.inclusion_tag('paginator.html', takes_context=True)(paginator)
+
+def hits_label(hits, estimated=False):
+    if hits is None:
+        return None
+    if estimated:
+        return ungettext('about %(count)s result', 'about %(count)s results',
+                         hits) % {'count': hits}
+    return ungettext('%(count)s result', '%(count)s results',
+                     hits) % {'count': hits}
+
+def keyset_paginator(context, page, with_total=False):
+    """
+    Adds next/previous links for a djutils.pagination.KeysetPage, without
+    counting the objects unless ``with_total`` is given (the count is then
+    cached, see KeysetPaginator.count).
+
+    The cursor is passed in the ``cursor`` query string parameter. You must
+    add 'django.core.context_processors.request' to your
+    TEMPLATE_CONTEXT_PROCESSORS setting.
+    """
+    request = context['request']
+    def url(cursor):
+        if cursor is None:
+            return None
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return '%s?%s' % (request.path, params.urlencode())
+    if with_total:
+        hits = page.paginator.count()
+    else:
+        hits = None
+    first = request.GET.copy()
+    first.pop('cursor', None)
+    return {
+        'page': page,
+        'object_list': page.object_list,
+        'results_per_page': page.paginator.per_page,
+        'has_next': page.has_next(),
+        'has_previous': page.has_previous(),
+        'next_url': url(page.next_cursor()),
+        'previous_url': url(page.previous_cursor()),
+        'first_url': '%s?%s' % (request.path, first.urlencode()),
+        'hits': hits,
+        'hits_label': hits_label(hits),
+    }
+
+register.inclusion_tag('keyset_paginator.html',
+                       takes_context=True)(keyset_paginator)
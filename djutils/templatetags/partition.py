@@ -15,12 +15,83 @@ A common use-case is for splitting a list into a table with columns::
         </tr>
     {% endfor %}
     </table>
+
+QuerySets aren't fetched as a whole by ``rows`` and ``rows_distributed``:
+they are counted once and every row is a lazy ``queryset[start:end]``, so
+each row is read with its own query when it is rendered (unordered
+QuerySets are ordered by primary key, to keep the rows consistent). Rows of other
+sequences are views over the original list rather than copies. ``columns``
+needs every item anyway, and reads QuerySets in full.
 """
 
+from django.db.models.query import QuerySet
 from django.template import Library
 
 register = Library()
 
+class ListSlice(object):
+    """
+    A read-only view of ``thelist[start:end]`` that doesn't copy the items.
+
+    >>> row = ListSlice(range(10), 3, 6)
+    >>> row[0], row[-1], row[1:]
+    (3, 5, [4, 5])
+
+    Other indexes raise TypeError like lists do, so the template variable
+    ``{{ row.0 }}`` falls back from ``row['0']`` to ``row[0]``:
+
+    >>> row['0']
+    Traceback (most recent call last):
+    ...
+    TypeError: ListSlice indices must be integers
+    """
+    def __init__(self, thelist, start, end):
+        self.thelist = thelist
+        self.start = start
+        self.end = max(start, min(end, len(thelist)))
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __iter__(self):
+        for i in xrange(self.start, self.end):
+            yield self.thelist[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if not isinstance(index, (int, long)):
+            raise TypeError('ListSlice indices must be integers')
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('ListSlice index out of range')
+        return self.thelist[self.start + index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(list(self))
+
+def _sliceable(thelist):
+    """
+    Returns ``(length, slicer)`` for ``thelist``, where ``slicer(start, end)``
+    returns a lazy slice: a sliced QuerySet or a ListSlice.
+    """
+    if isinstance(thelist, QuerySet):
+        if not thelist.ordered and thelist.query.can_filter():
+            # every row is a separate query: without an ordering the
+            # database could return the rows in a different order each time
+            thelist = thelist.order_by('pk')
+        return thelist.count(), lambda start, end: thelist[start:end]
+    if not isinstance(thelist, (list, tuple)):
+        thelist = list(thelist)
+    return len(thelist), lambda start, end: ListSlice(thelist, start, end)
+
 def rows(thelist, n):
     """
     Break a list into ``n`` rows, filling up each row to the maximum equal
@@ -49,15 +120,14 @@ def rows(thelist, n):
     """
     try:
         n = int(n)
-        thelist = list(thelist)
+        list_len, slicer = _sliceable(thelist)
     except (ValueError, TypeError):
         return [thelist]
-    list_len = len(thelist)
     split = list_len // n
 
     if list_len % n != 0:
         split += 1
-    return [thelist[split*i:split*(i+1)] for i in range(n)]
+    return [slicer(split*i, split*(i+1)) for i in range(n)]
 
 def rows_distributed(thelist, n):
     """
@@ -87,10 +157,9 @@ def rows_distributed(thelist, n):
     """
     try:
         n = int(n)
-        thelist = list(thelist)
+        list_len, slicer = _sliceable(thelist)
     except (ValueError, TypeError):
         return [thelist]
-    list_len = len(thelist)
     split = list_len // n
 
     remainder = list_len % n
@@ -101,7 +170,7 @@ def rows_distributed(thelist, n):
             start, end = (split+1)*i, (split+1)*(i+1)
         else:
             start, end = split*i+offset, split*(i+1)+offset
-        rows.append(thelist[start:end])
+        rows.append(slicer(start, end))
         if remainder:
             remainder -= 1
             offset += 1
@@ -0,0 +1,103 @@
+"""
+A small bounded pool of daemon threads for background work.
+"""
+import logging
+import sys
+import threading
+from Queue import Queue, Full
+
+class AsyncResult(object):
+    "The pending result of a call passed to ThreadPool.apply_async()."
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._exc_info = None
+
+    def _run(self, func, args, kwargs):
+        try:
+            self._value = func(*args, **kwargs)
+        except:
+            self._exc_info = sys.exc_info()
+        self._event.set()
+
+    def ready(self):
+        return self._event.isSet()
+
+    def get(self, timeout=None):
+        """
+        Waits for the call and returns its result, or re-raises its
+        exception. Raises RuntimeError if ``timeout`` seconds pass first.
+        """
+        self._event.wait(timeout)
+        if not self._event.isSet():
+            raise RuntimeError('Timed out waiting for a pooled call')
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._value
+
+class ThreadPool(object):
+    """
+    Runs submitted callables on at most ``workers`` threads, started on
+    demand. At most ``max_queue`` calls wait for a free thread: submit()
+    returns False instead of queueing more, apply_async() waits at most
+    ``timeout`` seconds (forever if None) for room in the queue. Exceptions
+    raised by submitted calls are logged to the ``logger`` logger.
+    """
+    def __init__(self, workers=4, max_queue=100, timeout=None,
+                 logger='djutils.threadpool'):
+        self.workers = workers
+        self.timeout = timeout
+        self.logger = logging.getLogger(logger)
+        self._queue = Queue(max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._lock.acquire()
+        try:
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        finally:
+            self._lock.release()
+
+    def _work(self):
+        while True:
+            func, args, kwargs = self._queue.get()
+            try:
+                func(*args, **kwargs)
+            except:
+                self.logger.exception('Pooled call %r failed', func)
+            self._queue.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        "Queues ``func(*args, **kwargs)``, returns False if the queue is full."
+        if len(self._threads) < self.workers:
+            self._start()
+        try:
+            self._queue.put_nowait((func, args, kwargs))
+        except Full:
+            return False
+        return True
+
+    def apply_async(self, func, *args, **kwargs):
+        """
+        Queues ``func(*args, **kwargs)`` and returns an AsyncResult. Unlike
+        submit(), waits for room in the queue when it is full, and raises
+        RuntimeError if there is none after the pool's ``timeout``.
+        """
+        if len(self._threads) < self.workers:
+            self._start()
+        result = AsyncResult()
+        try:
+            self._queue.put((result._run, (func, args, kwargs), {}),
+                            timeout=self.timeout)
+        except Full:
+            raise RuntimeError('Timed out waiting for a free pooled thread')
+        return result
+
+    def join(self):
+        "Waits until every queued call has run."
+        self._queue.join()
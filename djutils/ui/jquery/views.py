@@ -1,7 +1,9 @@
 from django.views.decorators.cache import cache_page
 from django.http import HttpResponse, HttpResponseBadRequest
 
-def autocomplete(request, queryset, search_by):
+from djutils.http.background import run_query
+
+def autocomplete(request, queryset, search_by, background=False):
     def iter_results(results):
         if results:
             for result in results:
@@ -19,6 +21,14 @@ def autocomplete(request, queryset, search_by):
         return HttpResponseBadRequest() 
 
     results = queryset.filter(**{'%s__startswith' % search_by: q})[:limit]
-    return HttpResponse(iter_results(results), mimetype='text/plain')
+    if background:
+        # read the results on the bounded pool of djutils.http.background
+        results = run_query(list, results)
+    # joined, since cache_page can't pickle a response holding a generator
+    return HttpResponse(u''.join(iter_results(results)), mimetype='text/plain')
 
 autocomplete = cache_page(autocomplete, 60 * 60)
+
+def background_autocomplete(request, queryset, search_by):
+    "Like autocomplete, running the query on the database thread pool."
+    return autocomplete(request, queryset, search_by, background=True)